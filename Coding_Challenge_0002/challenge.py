@@ -11,6 +11,22 @@ list_of_text = ["0001;02-03-20 13:00;In-progress", "0002":"0002;02-04-20 13:00;D
 final_result_dict_of_texts = {"0001":"0001;02-03-20 13:00;In-progress", "0002":"0002;02-04-20 13:00;Done",
 "0003":"0003;02-05-20 13:00;Not-Started"}
 """
+import argparse
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Union
+
+# duplicate key policies of index_records(): keep the first text, keep the last text or collect all texts in a list
+DUPLICATE_POLICIES = ('first', 'last', 'collect')
+# number of characters read at once from a file
+READ_BLOCK_SIZE = 1 << 20
+# header of offset index files: magic, duplicate policy, size and modification time of the indexed file, number of
+# keys
+# version 2: keys of CRLF lines without ';' no longer end with '\r'
+OFFSET_INDEX_MAGIC = b'OIDX\x02'
+OFFSET_INDEX_HEADER = struct.Struct('<5s8sQqQ')
 
 
 def long_version():
@@ -51,7 +67,239 @@ def fun_with_tuples():
     print(result)
 
 
+def iter_line_blocks(file: TextIO, block_size: int = READ_BLOCK_SIZE) -> Iterator[List[str]]:
+    """
+    Read a file in blocks and split the blocks into lines (without line breaks). Only one block is held in memory; a
+    line spanning two blocks is completed with the next block.
+    :param file: file to read
+    :param block_size: number of characters to read at once
+    :return: iterator over lists of lines
+    """
+    rest = ''
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        lines = (rest + block).split('\n')
+        # the last part is either empty or an incomplete line
+        rest = lines.pop()
+        yield lines
+    if rest:
+        yield [rest]
+
+
+def index_records(blocks: Iterable[Iterable[str]], duplicates: str = 'last') -> Dict[str, Union[str, List[str]]]:
+    """
+    Build the dictionary in a single pass over (possibly streamed) blocks of texts. The key is obtained with
+    str.partition(), which only scans up to the first semicolon instead of splitting all fields.
+    :param blocks: blocks of texts; empty texts are ignored
+    :param duplicates: what to do with texts with the same key: 'first': keep the first text, 'last': keep the last
+        text (like the dict comprehensions above), 'collect': value is a list of all texts
+    :return: dictionary
+    """
+    if duplicates not in DUPLICATE_POLICIES:
+        raise ValueError(f'unsupported duplicate policy: {duplicates}')
+    result = {}
+    for texts in blocks:
+        if duplicates == 'last':
+            result.update({text.partition(';')[0]: text for text in texts if text})
+        elif duplicates == 'first':
+            # setdefault() keeps the first text
+            for text in texts:
+                if text:
+                    result.setdefault(text.partition(';')[0], text)
+        else:
+            for text in texts:
+                if text:
+                    key = text.partition(';')[0]
+                    if key in result:
+                        result[key].append(text)
+                    else:
+                        result[key] = [text]
+    return result
+
+
+def index_file(path: str, duplicates: str = 'last', encoding: str = 'utf-8',
+               block_size: int = READ_BLOCK_SIZE) -> Dict[str, Union[str, List[str]]]:
+    """
+    Build the dictionary for a file with one text per line. The file is streamed in blocks: there is never a list of
+    all lines.
+    :param path: file to read
+    :param duplicates: duplicate key policy, see index_records()
+    :param encoding: encoding of the file
+    :param block_size: number of characters to read at once
+    :return: dictionary
+    """
+    # universal newlines: \r\n is read as \n
+    with open(path, encoding=encoding) as file:
+        return index_records(iter_line_blocks(file, block_size), duplicates=duplicates)
+
+
+class OffsetIndex:
+    """
+    Dictionary of a file with one text per line which doesn't hold the texts: keys are mapped to a slot in two arrays
+    with offset and length of the text in the file. The file is memory mapped and a text is only decoded when it is
+    looked up. The index is stored in a sidecar file (<file>.idx) and reloaded without scanning the file as long as
+    size and modification time of the file are unchanged.
+    """
+
+    def __init__(self, path: str, duplicates: str = 'last', encoding: str = 'utf-8'):
+        """
+        :param path: file with one text per line
+        :param duplicates: what to do with texts with the same key: 'first': keep the first text, 'last': keep the
+            last text
+        :param encoding: encoding of the file
+        """
+        if duplicates not in ('first', 'last'):
+            raise ValueError(f'unsupported duplicate policy: {duplicates}')
+        self.path = path
+        self.index_path = f'{path}.idx'
+        self.duplicates = duplicates
+        self.encoding = encoding
+        self._slots = {}
+        self._offsets = array('q')
+        self._lengths = array('I')
+        self._file = open(path, mode='rb')
+        stat = os.fstat(self._file.fileno())
+        # an empty file can't be memory mapped
+        self._map: Optional[mmap.mmap] = (mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                                          if stat.st_size else None)
+        if not self.load(stat.st_size, stat.st_mtime_ns):
+            self._scan()
+            self.save(stat.st_size, stat.st_mtime_ns)
+
+    def _scan(self, block_size: int = READ_BLOCK_SIZE) -> None:
+        """
+        Build the index from the file: a single pass over blocks of the memory mapped file
+        :param block_size: number of bytes to process at once
+        :return: None
+        """
+        slots = self._slots
+        offsets = self._offsets
+        lengths = self._lengths
+        first = self.duplicates == 'first'
+        size = len(self._map) if self._map is not None else 0
+        offset = 0
+        for start in range(0, size, block_size):
+            # blocks start at the first line not yet processed
+            lines = self._map[offset:start + block_size].split(b'\n')
+            if start + block_size < size:
+                # the last part is an incomplete line; it's processed with the next block
+                lines.pop()
+            for line in lines:
+                length = len(line)
+                if line.endswith(b'\r'):
+                    length -= 1
+                if length:
+                    key = line[:length].partition(b';')[0].decode(self.encoding)
+                    slot = slots.get(key)
+                    if slot is None:
+                        slots[key] = len(offsets)
+                        offsets.append(offset)
+                        lengths.append(length)
+                    elif not first:
+                        offsets[slot] = offset
+                        lengths[slot] = length
+                offset += len(line) + 1
+
+    def load(self, size: int, mtime_ns: int) -> bool:
+        """
+        Load the index from the sidecar file
+        :param size: size of the indexed file
+        :param mtime_ns: modification time of the indexed file
+        :return: True if the index has been loaded, False if there is no index for this version of the file and
+            duplicate policy
+        """
+        try:
+            with open(self.index_path, mode='rb') as f:
+                magic, duplicates, index_size, index_mtime_ns, count = OFFSET_INDEX_HEADER.unpack(
+                    f.read(OFFSET_INDEX_HEADER.size))
+                # struct pads the duplicate policy with null bytes
+                if (magic, duplicates.rstrip(b'\0'), index_size, index_mtime_ns) != (
+                        OFFSET_INDEX_MAGIC, self.duplicates.encode(), size, mtime_ns):
+                    return False
+                self._offsets.fromfile(f, count)
+                self._lengths.fromfile(f, count)
+                keys = f.read().decode(self.encoding).split('\n') if count else []
+        except (OSError, EOFError, struct.error, UnicodeDecodeError):
+            self._offsets = array('q')
+            self._lengths = array('I')
+            return False
+        self._slots = dict(zip(keys, range(count)))
+        return True
+
+    def save(self, size: int, mtime_ns: int) -> None:
+        """
+        Write the index to the sidecar file. The index is written to a temporary file which then replaces the
+        sidecar file, so that a reader never sees an incomplete index.
+        :param size: size of the indexed file
+        :param mtime_ns: modification time of the indexed file
+        :return: None
+        """
+        temp_path = f'{self.index_path}.tmp'
+        with open(temp_path, mode='wb') as f:
+            f.write(OFFSET_INDEX_HEADER.pack(OFFSET_INDEX_MAGIC, self.duplicates.encode(), size, mtime_ns,
+                                             len(self._offsets)))
+            self._offsets.tofile(f)
+            self._lengths.tofile(f)
+            # slots are assigned in order of the keys
+            f.write('\n'.join(self._slots).encode(self.encoding))
+        os.replace(temp_path, self.index_path)
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        slot = self._slots.get(key)
+        if slot is None:
+            return default
+        offset = self._offsets[slot]
+        return self._map[offset:offset + self._lengths[slot]].decode(self.encoding)
+
+    def __getitem__(self, key: str) -> str:
+        text = self.get(key)
+        if text is None:
+            raise KeyError(key)
+        return text
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def keys(self) -> Iterable[str]:
+        return self._slots.keys()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self) -> 'OffsetIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a dictionary of semicolon separated texts')
+    parser.add_argument('file', nargs='?', help='file with one text per line; without a file the examples are run')
+    parser.add_argument('--duplicates', choices=DUPLICATE_POLICIES, default='last',
+                        help='texts with duplicate keys: keep the first/last text or collect all texts')
+    parser.add_argument('--get', metavar='KEY', action='append',
+                        help='look up texts with an offset index of the file (stored in <file>.idx)')
+    args = parser.parse_args()
+    if args.file and args.get:
+        if args.duplicates not in ('first', 'last'):
+            parser.error('--get only supports --duplicates first or last')
+        with OffsetIndex(args.file, duplicates=args.duplicates) as index:
+            for key in args.get:
+                print(index.get(key))
+        parser.exit()
+    if args.file:
+        print(f'{len(index_file(args.file, duplicates=args.duplicates))} keys')
+        parser.exit()
+
     long_version()
     short_version()
     fun_with_tuples()
\ No newline at end of file
@@ -12,33 +12,224 @@ For instance, if input number is 4, then it should display the table of 1, 2, 3
 Please notice that the function called func_many_multiplication should use the first function called
 func_single_multiplication.
 """
+import argparse
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterator, List, Optional, TextIO, Union
 
+try:
+    import numpy
+except ImportError:
+    # optional: the matrix functions fall back to pure Python
+    numpy = None
 
-def func_single_multiplication(number: int) -> None:
+# number of rendered tables to keep
+TABLE_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=None)
+def _table_template(first: int, last: int, width: int) -> str:
+    """
+    %-format template for a complete table; only depends on the range of factors and the width of the results
+    """
+    index_width = max(2, len(str(last)))
+    rows = ''.join(f'{i:{index_width}} x %d = %{width}d\n' for i in range(first, last + 1))
+    return f'Multiplication table from {first} to {last} for %d\n{rows}'
+
+
+@lru_cache(maxsize=TABLE_CACHE_SIZE)
+def _render_table(number: int, first: int, last: int, width: int) -> str:
+    values = [number]
+    for i in range(first, last + 1):
+        values.append(number)
+        values.append(number * i)
+    # a single formatting operation for the whole table
+    return _table_template(first, last, width) % tuple(values)
+
+
+def render_single_multiplication(number: int, first: int = 1, last: int = 10, width: Optional[int] = None) -> str:
+    """
+    Render a multiplication table. Rendered tables are cached, so rendering the same table again is cheap.
+    :param number: number for which to create a multiplication table
+    :param first: first factor
+    :param last: last factor
+    :param width: width of the results; default: width of the largest result
+    :return: table as text
+    """
+    if width is None:
+        # we want to make sure that the results are printed right justified; so we need to know the max length of the
+        # output
+        width = max(len(str(first * number)), len(str(last * number)))
+    return _render_table(number, first, last, width)
+
+
+def func_single_multiplication(number: int, file: Union[TextIO, 'Sink', None] = None) -> None:
     """
     Print a multiplication table (1 to 10) for a given number
     :param number: number for which to create a multiplication table
+    :param file: file or sink to print to; default: stdout
     :return: None
     """
-    print(f'Multiplication table from 1 to 10 for {number}')
+    (file or sys.stdout).write(render_single_multiplication(number))
+
+
+def iter_many_multiplication(number: int, first: int = 1, chunk_size: int = 0) -> Iterator[str]:
+    """
+    Lazily render the multiplication tables of each number from first to the given number; like
+    func_many_multiplication() each table is followed by an empty line
+    :param number: Maximum number to render a multiplication table for
+    :param first: first number to render a multiplication table for
+    :param chunk_size: 0: yield each table separately; else: join tables to chunks of at least chunk_size characters
+    :return: iterator over rendered tables or chunks of tables
+    """
+    if not chunk_size:
+        for i in range(first, number + 1):
+            yield render_single_multiplication(i) + '\n'
+        return
+    parts = []
+    size = 0
+    for i in range(first, number + 1):
+        table = render_single_multiplication(i)
+        parts.append(table)
+        parts.append('\n')
+        size += len(table) + 1
+        if size >= chunk_size:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield ''.join(parts)
 
-    # we want to make sure that the resuls are printed right justified; so we need to know the max length of the output
-    result_length = len(str(10 * number))
 
-    # iterate 1..10
-    for i in range(1, 11):
-        print(f'{i:2} x {number} = {number * i:{result_length}}')
+# number of characters a Sink collects before writing to its target
+SINK_BUFFER_SIZE = 1 << 20
 
 
-def func_many_multiplication(number: int) -> None:
+class Sink:
+    """
+    Buffered text output. Written text is collected and passed on to the target in writes of at least buffer_size
+    characters, so memory use is bounded and the number of writes (system calls) is small.
+    """
+
+    def __init__(self, target: TextIO, buffer_size: int = SINK_BUFFER_SIZE, close_target: bool = False):
+        """
+        :param target: file to write to
+        :param buffer_size: number of characters to collect before writing to the target; 0: no buffering
+        :param close_target: close the target when the sink is closed
+        """
+        self.target = target
+        self.buffer_size = buffer_size
+        self._close_target = close_target
+        self._parts = []
+        self._size = 0
+
+    @classmethod
+    def stdout(cls, buffer_size: int = SINK_BUFFER_SIZE) -> 'Sink':
+        return cls(sys.stdout, buffer_size=buffer_size)
+
+    @classmethod
+    def file(cls, path: str, buffer_size: int = SINK_BUFFER_SIZE) -> 'Sink':
+        # the sink does the buffering; the file itself is opened with the same buffer size
+        return cls(open(path, mode='w', buffering=max(buffer_size, io.DEFAULT_BUFFER_SIZE)), buffer_size=buffer_size,
+                   close_target=True)
+
+    @classmethod
+    def memory(cls) -> 'Sink':
+        # collecting in memory before writing to memory doesn't help
+        return cls(io.StringIO(), buffer_size=0)
+
+    def write(self, text: str) -> int:
+        if self._size + len(text) < self.buffer_size:
+            self._parts.append(text)
+            self._size += len(text)
+        elif self._parts:
+            self._parts.append(text)
+            self.flush()
+        else:
+            self.target.write(text)
+        return len(text)
+
+    def flush(self) -> None:
+        if self._parts:
+            self.target.write(''.join(self._parts))
+            self._parts = []
+            self._size = 0
+        self.target.flush()
+
+    def getvalue(self) -> str:
+        """
+        Content written so far; only for in-memory sinks
+        """
+        self.flush()
+        return self.target.getvalue()
+
+    def close(self) -> None:
+        self.flush()
+        if self._close_target:
+            self.target.close()
+
+    def __enter__(self) -> 'Sink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def func_many_multiplication(number: int, file: Union[TextIO, Sink, None] = None,
+                             buffer_size: int = SINK_BUFFER_SIZE) -> None:
     """
     Display the multiplication table of each number from 1 to the given parameter
     :param number: Maximum number to display a multiplication table for
+    :param file: file or sink to print to; default: stdout
+    :param buffer_size: number of characters to collect before writing to the file; ignored if file is a sink
     :return: None
     """
+    # tables are written to a sink: output is streamed in large writes instead of line by line
+    sink = file if isinstance(file, Sink) else Sink(file or sys.stdout, buffer_size=buffer_size)
     for i in range(1, number + 1):
-        func_single_multiplication(i)
-        print()
+        func_single_multiplication(i, file=sink)
+        sink.write('\n')
+    sink.flush()
+
+
+# number of tables rendered by a worker in one task of parallel_many_multiplication()
+PARTITION_SIZE = 10000
+
+
+def _render_partition(first: int, last: int) -> str:
+    return ''.join(iter_many_multiplication(last, first=first))
+
+
+def parallel_many_multiplication(number: int, file: Union[TextIO, Sink, None] = None, workers: Optional[int] = None,
+                                 partition_size: int = PARTITION_SIZE) -> None:
+    """
+    Parallel version of func_many_multiplication() for huge numbers: partitions of the range of numbers are rendered in
+    a pool of processes and written in the order of the partitions. Each table only depends on its own number, so the
+    output is identical to the output of func_many_multiplication().
+    :param number: Maximum number to display a multiplication table for
+    :param file: file or sink to print to; default: stdout
+    :param workers: number of worker processes; default: number of CPUs
+    :param partition_size: number of tables per partition
+    :return: None
+    """
+    file = file or sys.stdout
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # only keep a limited number of partitions in flight to bound the memory used for output not yet written
+        in_flight = []
+        partitions = iter(range(1, number + 1, partition_size))
+        while True:
+            for first in partitions:
+                in_flight.append(executor.submit(_render_partition, first, min(first + partition_size - 1, number)))
+                if len(in_flight) >= 2 * workers:
+                    break
+            if not in_flight:
+                break
+            file.write(in_flight.pop(0).result())
+    file.flush()
 
 
 def short_but_unreadable(number: int):
@@ -52,6 +243,177 @@ def short_but_unreadable(number: int):
                      range(1, number + 1))))
 
 
+# number of matrix rows formatted and written at once by export_matrix()
+MATRIX_CHUNK_ROWS = 10000
+
+
+def multiplication_matrix(rows: range, columns: range) -> Union['numpy.ndarray', List[List[int]]]:
+    """
+    Multiplication matrix: products of all row and column factors. With numpy the matrix is calculated in one
+    vectorized step (outer product).
+    :param rows: row factors
+    :param columns: column factors
+    :return: matrix; numpy array if numpy is available else list of rows
+    """
+    if numpy is not None:
+        return numpy.multiply.outer(numpy.arange(rows.start, rows.stop, rows.step, dtype=numpy.int64),
+                                    numpy.arange(columns.start, columns.stop, columns.step, dtype=numpy.int64))
+    return [[row * column for column in columns] for row in rows]
+
+
+@lru_cache(maxsize=None)
+def _digit_groups() -> 'numpy.ndarray':
+    """
+    Characters of all groups of 4 digits, one uint32 (4 ASCII bytes) per entry: 0-9999 zero padded at index 0-9999,
+    padded with spaces at index 10000-19999 and 4 spaces at index 20000
+    :return: numpy array
+    """
+    text = ''.join(f'{i:04d}' for i in range(10000)) + ''.join(f'{i:4d}' for i in range(10000)) + '    '
+    return numpy.frombuffer(text.encode(), dtype=numpy.uint32)
+
+
+def render_fixed_width(values: 'numpy.ndarray', width: int) -> 'numpy.ndarray':
+    """
+    Render integers right justified into fields of fixed width without formatting the numbers one by one: the
+    characters of each group of 4 digits are looked up in a table for all values at once.
+    :param values: numpy integer array
+    :param width: field width; at least the number of characters (digits and sign) of the longest value
+    :return: numpy uint8 array (ASCII) with shape values.shape + (width,)
+    """
+    magnitude = numpy.abs(values)
+    top = int(magnitude.max(initial=0))
+    groups = max(1, -(-len(str(top)) // 4))
+    remaining = magnitude.astype(numpy.uint32 if top < 2 ** 32 else numpy.uint64)
+    chars = numpy.empty(values.shape + (groups,), dtype=numpy.uint32)
+    table = _digit_groups()
+    # True for values whose leading group is below the current group
+    leading = None
+    for group in range(groups - 1, -1, -1):
+        remaining, digits = numpy.divmod(remaining, 10000)
+        # 1: leading group of a value, padded with spaces instead of zeros; 2: in front of the value, all spaces
+        blank = (remaining == 0).astype(remaining.dtype)
+        if leading is not None:
+            blank += leading
+        chars[..., group] = table.take(digits + blank * 10000)
+        leading = blank.astype(bool)
+    rendered = chars.view(numpy.uint8).reshape(values.shape + (4 * groups,))
+    if 4 * groups < width:
+        rendered = numpy.concatenate((numpy.full(values.shape + (width - 4 * groups,), ord(' '), dtype=numpy.uint8),
+                                      rendered), axis=-1)
+    else:
+        rendered = rendered[..., 4 * groups - width:]
+    negative = numpy.nonzero(values < 0)
+    if negative[0].size:
+        # the sign goes in front of the first digit
+        digits = numpy.searchsorted(10 ** numpy.arange(1, 19, dtype=numpy.int64), magnitude[negative], side='right') + 1
+        rendered[negative + (width - 1 - digits,)] = ord('-')
+    return rendered
+
+
+def _render_matrix_rows(labels: 'numpy.ndarray', matrix: 'numpy.ndarray', label_width: int, width: int,
+                        label_separator: bytes, separator: bytes) -> 'numpy.ndarray':
+    """
+    Render rows of a matrix with fixed-width fields
+    :param labels: row labels
+    :param matrix: matrix rows
+    :param label_width: width of the label field
+    :param width: width of the matrix fields
+    :param label_separator: characters between label and first matrix field
+    :param separator: character between matrix fields
+    :return: numpy uint8 array (ASCII) with one row per matrix row, each ending with a newline
+    """
+    rows, columns = matrix.shape
+    prefix = label_width + len(label_separator)
+    out = numpy.empty((rows, prefix + columns * (width + 1)), dtype=numpy.uint8)
+    out[:, :label_width] = render_fixed_width(labels, label_width)
+    out[:, label_width:prefix] = numpy.frombuffer(label_separator, dtype=numpy.uint8)
+    fields = out[:, prefix:].reshape(rows, columns, width + 1)
+    fields[..., :width] = render_fixed_width(matrix, width)
+    fields[..., width] = ord(separator)
+    fields[:, -1, width] = ord('\n')
+    return out
+
+
+def export_matrix(rows: range, columns: range, file: Optional[TextIO] = None, fmt: str = 'text',
+                  chunk_rows: int = MATRIX_CHUNK_ROWS) -> None:
+    """
+    Write a multiplication matrix. The matrix is calculated and written in chunks of rows: each chunk is formatted
+    at once (with numpy vectorized, see render_fixed_width(), else with a single formatting operation) and written
+    with a single write. Memory use only depends on the chunk size.
+    :param rows: row factors
+    :param columns: column factors
+    :param file: file to write to; default: stdout
+    :param fmt: 'text': right justified columns with the row factor as label (like short_but_unreadable()); 'csv':
+        comma separated with the column factors as header
+    :param chunk_rows: number of rows per chunk
+    :return: None
+    """
+    file = file or sys.stdout
+    if not rows or not columns:
+        return
+    # widths are determined once: the extreme values are at the corners of the matrix
+    label_width = max(len(str(rows[0])), len(str(rows[-1])))
+    width = max(len(str(row * column)) for row in (rows[0], rows[-1]) for column in (columns[0], columns[-1]))
+    if fmt == 'csv':
+        file.write(','.join(['x'] + [str(column) for column in columns]) + '\n')
+        row_template = '%d,' + ','.join(['%d'] * len(columns)) + '\n'
+        label_separator, separator = b',', b','
+    elif fmt == 'text':
+        row_template = f'%{label_width}d: ' + ' '.join([f'%{width}d'] * len(columns)) + '\n'
+        label_separator, separator = b': ', b' '
+    else:
+        raise ValueError(f'unsupported format: {fmt}')
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        matrix = multiplication_matrix(chunk, columns)
+        if numpy is not None:
+            rendered = _render_matrix_rows(numpy.arange(chunk.start, chunk.stop, chunk.step, dtype=numpy.int64),
+                                           matrix, label_width, width, label_separator, separator)
+            if fmt == 'csv':
+                # CSV fields aren't padded
+                rendered = rendered[rendered != ord(' ')]
+            if hasattr(file, 'buffer'):
+                # ASCII: the rendered bytes can be written to the binary buffer of the file directly
+                file.flush()
+                file.buffer.write(rendered)
+            else:
+                file.write(rendered.tobytes().decode('ascii'))
+        else:
+            values = [v for row, products in zip(chunk, matrix) for v in (row, *products)]
+            file.write((row_template * len(chunk)) % tuple(values))
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Multiplication tables')
+    parser.add_argument('--rows', type=int, nargs=2, metavar=('FIRST', 'LAST'),
+                        help='export a multiplication matrix with these row factors and exit')
+    parser.add_argument('--columns', type=int, nargs=2, metavar=('FIRST', 'LAST'), default=(1, 10),
+                        help='column factors of the matrix; default: 1 10')
+    parser.add_argument('--format', choices=('text', 'csv'), default='text', help='format of the matrix')
+    parser.add_argument('--tables', type=int, metavar='N',
+                        help='print the multiplication tables of the numbers from 1 to N and exit')
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help='render the tables of --tables in N worker processes; 0: number of CPUs')
+    parser.add_argument('--buffer-size', type=int, default=SINK_BUFFER_SIZE,
+                        help=f'characters to collect before writing tables; default: {SINK_BUFFER_SIZE}')
+    parser.add_argument('--output', metavar='FILE', help='file to write the matrix or tables to; default: stdout')
+    args = parser.parse_args()
+    if args.tables is not None:
+        with (Sink.file(args.output, args.buffer_size) if args.output else Sink.stdout(args.buffer_size)) as sink:
+            if args.workers is not None:
+                parallel_many_multiplication(args.tables, file=sink, workers=args.workers)
+            else:
+                func_many_multiplication(args.tables, file=sink)
+        parser.exit()
+    if args.rows:
+        matrix_rows = range(args.rows[0], args.rows[1] + 1)
+        matrix_columns = range(args.columns[0], args.columns[1] + 1)
+        if args.output:
+            with open(args.output, mode='w') as output:
+                export_matrix(matrix_rows, matrix_columns, file=output, fmt=args.format)
+        else:
+            export_matrix(matrix_rows, matrix_columns, fmt=args.format)
+        parser.exit()
+
     func_many_multiplication(10)
     short_but_unreadable(10)
@@ -25,17 +25,51 @@ For the first pair, if you use (occurrence, parity) then for the next you should
 'odd'), 'j':('odd',1), 'u':(1,'odd'), 'y':('even',2), '0':(3,'odd'), '4':('odd',1), '.':(1,'odd')}
 """
 
-from collections import Counter, defaultdict
-from time import time
+import argparse
+import atexit
+import codecs
+import json
+import mmap
+import os
+import platform
+import statistics
+import sys
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from time import perf_counter_ns
 from random import choices
 from string import ascii_lowercase
-from typing import List, Dict, Optional, Callable
+from typing import Any, BinaryIO, List, Dict, Iterator, Optional, Callable, Tuple, Union
 
+from instrumentation import instrumented, metrics, start_profile
 
+try:
+    import numpy
+except ImportError:
+    # optional: dictionary_of_occurrences_bytes() falls back to a slower pure Python histogram
+    numpy = None
+
+# size of the byte ranges counted by the worker processes in parallel_statistics()
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+@instrumented()
 def short_solution(target: str) -> None:
     list_of_characters = list(set(target))
     dictionary_of_occurrences = dict(Counter(target))
+    dictionary_of_attributes = attributes_from_occurrences(dictionary_of_occurrences)
+    print_statistics(len(target), list_of_characters, dictionary_of_occurrences, dictionary_of_attributes)
 
+
+@instrumented()
+def attributes_from_occurrences(dictionary_of_occurrences: Dict[str, int]) -> Dict[str, Tuple[Union[int, str], ...]]:
+    """
+    Build the dictionary of attributes: for each character a tuple with the number of occurrences and the parity. The
+    order of the tuple elements alternates.
+    :param dictionary_of_occurrences: number of occurrences per character
+    :return: dictionary of attributes
+    """
     # hard to read one-liner: not a good example :-)
     # % is the modulo operator in Python
     # x % 2 is 1 for odd numbers and 0 for even numbers
@@ -49,15 +83,215 @@ def short_solution(target: str) -> None:
     # finally the full expression is a dict comprehension creating a dictionary with the character as key and a tuple
     # as value. The tuple has either even/odd followed by the number of occurrences (s, v) or the number of occurrences
     # followed by even/odd. The order alternates.
-    dictionary_of_attributes = {k: (v, s) if i % 2 else (s, v) for i, (k, v, s) in enumerate(
+    return {k: (v, s) if i % 2 else (s, v) for i, (k, v, s) in enumerate(
         (k, v, 'odd' if v % 2 else 'even') for k, v in dictionary_of_occurrences.items())}
 
-    print(f'number of characters : {len(target)}')
+
+def print_statistics(number_of_characters: int, list_of_characters: List[str],
+                     dictionary_of_occurrences: Dict[str, int],
+                     dictionary_of_attributes: Dict[str, Tuple[Union[int, str], ...]]) -> None:
+    print(f'number of characters : {number_of_characters}')
     print(f'list of characters : {list_of_characters}')
     print(f'dictionary of occurrences : {dictionary_of_occurrences}')
     print(f'dictionary of attributes : {dictionary_of_attributes}')
 
 
+def utf8_ranges(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[int, int]]:
+    """
+    Split a UTF-8 encoded file into ranges of roughly chunk_size bytes. Ranges never split a character, so each range
+    can be decoded on its own.
+    :param path: file to split
+    :param chunk_size: target size of each range
+    :return: generator of (start, end) tuples
+    """
+    with open(path, mode='rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+            f.seek(end)
+            # move on to the start of the next character: continuation bytes look like 0b10xxxxxx
+            for byte in f.read(3):
+                if byte & 0xc0 != 0x80:
+                    break
+                end += 1
+            yield start, end
+            start = end
+
+
+def _count_range(path: str, start: int, end: int) -> Counter:
+    with open(path, mode='rb') as f:
+        f.seek(start)
+        return Counter(f.read(end - start).decode('utf-8'))
+
+
+@instrumented()
+def parallel_statistics(path: str, workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> \
+        Tuple[int, List[str], Dict[str, int], Dict[str, Tuple[Union[int, str], ...]]]:
+    """
+    Map-reduce version of the statistics for huge UTF-8 text files: ranges of the file are read, decoded and counted in
+    a pool of processes and the per-range counters are merged in the order of the ranges. Counters keep the order in
+    which characters have been seen first; merging in order keeps that order for the whole text.
+    :param path: UTF-8 encoded text file
+    :param workers: number of worker processes; default: number of CPUs
+    :param chunk_size: number of bytes per range
+    :return: tuple of number of characters, list of characters (in order of first occurrence), dictionary of
+        occurrences and dictionary of attributes
+    """
+    workers = workers or os.cpu_count() or 1
+    occurrences = Counter()
+    # tasks only refer to byte ranges: each worker reads its ranges from the file itself
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # only keep a limited number of ranges in flight to limit the number of results waiting to be merged
+        in_flight = []
+        ranges = utf8_ranges(path, chunk_size)
+        while True:
+            for start, end in ranges:
+                in_flight.append(executor.submit(_count_range, path, start, end))
+                if len(in_flight) >= 2 * workers:
+                    break
+            if not in_flight:
+                break
+            occurrences.update(in_flight.pop(0).result())
+    dictionary_of_occurrences = dict(occurrences)
+    return (sum(dictionary_of_occurrences.values()), list(dictionary_of_occurrences), dictionary_of_occurrences,
+            attributes_from_occurrences(dictionary_of_occurrences))
+
+
+@instrumented()
+def stream_statistics(blocks: Iterator[bytes], encoding: str = 'utf-8') -> \
+        Tuple[int, List[str], Dict[str, int], Dict[str, Tuple[Union[int, str], ...]]]:
+    """
+    Statistics for a text which is too big to be held in memory. The text is decoded and counted block by block; an
+    incremental decoder takes care of characters split across blocks.
+    :param blocks: encoded text in blocks of bytes
+    :param encoding: encoding of the text
+    :return: tuple of number of characters, list of characters (in order of first occurrence), dictionary of
+        occurrences and dictionary of attributes
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    occurrences = Counter()
+    for block in blocks:
+        occurrences.update(decoder.decode(block))
+    occurrences.update(decoder.decode(b'', final=True))
+    dictionary_of_occurrences = dict(occurrences)
+    return (sum(dictionary_of_occurrences.values()), list(dictionary_of_occurrences), dictionary_of_occurrences,
+            attributes_from_occurrences(dictionary_of_occurrences))
+
+
+def read_blocks(file: BinaryIO, block_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Read a file block by block. Regular files are read through a memory map, anything else (pipes, ..) is read using
+    buffered reads.
+    :param file: file opened in binary mode
+    :param block_size: size of the blocks
+    :return: generator of blocks
+    """
+    try:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # not a regular file or an empty file
+        while block := file.read(block_size):
+            yield block
+        return
+    with mapped:
+        for offset in range(0, len(mapped), block_size):
+            yield mapped[offset:offset + block_size]
+
+
+@instrumented()
+def file_statistics(path: str, block_size: int = CHUNK_SIZE) -> \
+        Tuple[int, List[str], Dict[str, int], Dict[str, Tuple[Union[int, str], ...]]]:
+    """
+    Statistics for an UTF-8 encoded file using constant memory
+    :param path: file name; '-' for stdin
+    :param block_size: size of the blocks to read
+    :return: tuple of number of characters, list of characters (in order of first occurrence), dictionary of
+        occurrences and dictionary of attributes
+    """
+    if path == '-':
+        return stream_statistics(read_blocks(sys.stdin.buffer, block_size))
+    with open(path, mode='rb') as f:
+        return stream_statistics(read_blocks(f, block_size))
+
+
+class CharStats:
+    """
+    Statistics for a sliding window over a stream of text (typed text, messages, ..).
+    Text is added at the end of the window with feed() and removed from the start of the window with evict(). Both
+    only cost O(len(text)). For each character the positions in the window are kept; this gives the number of
+    occurrences and the order of first occurrence without looking at the whole window again.
+    """
+
+    def __init__(self, text: str = ''):
+        # positions (absolute; counting from the start of the stream) of each character in the window
+        self._positions: Dict[str, deque] = {}
+        # absolute positions of the start and the end of the window
+        self._start = 0
+        self._end = 0
+        self.feed(text)
+
+    def __len__(self):
+        return self._end - self._start
+
+    @instrumented()
+    def feed(self, text: str) -> None:
+        """
+        Add text at the end of the window
+        :param text: text to add
+        :return: None
+        """
+        positions = self._positions
+        position = self._end
+        for c in text:
+            character_positions = positions.get(c)
+            if character_positions is None:
+                positions[c] = character_positions = deque()
+            character_positions.append(position)
+            position += 1
+        self._end = position
+
+    @instrumented()
+    def evict(self, text: str) -> None:
+        """
+        Remove text from the start of the window
+        :param text: text to remove; has to be the text at the start of the window
+        :return: None
+        :raises: ValueError if the text isn't the start of the window
+        """
+        positions = self._positions
+        # check first so that the window stays unchanged if the text doesn't match
+        seen = defaultdict(int)
+        for position, c in enumerate(text, start=self._start):
+            character_positions = positions.get(c)
+            if not character_positions or len(character_positions) <= seen[c] or \
+                    character_positions[seen[c]] != position:
+                raise ValueError('text is not the start of the window')
+            seen[c] += 1
+        for c in text:
+            character_positions = positions[c]
+            character_positions.popleft()
+            if not character_positions:
+                del positions[c]
+        self._start += len(text)
+
+    @instrumented()
+    def snapshot(self) -> Tuple[int, List[str], Dict[str, int], Dict[str, Tuple[Union[int, str], ...]]]:
+        """
+        Statistics for the current window; same as short_solution() would print for the text in the window
+        :return: tuple of number of characters, list of characters, dictionary of occurrences and dictionary of
+            attributes
+        """
+        # order of first occurrence in the window
+        characters = sorted(self._positions, key=lambda c: self._positions[c][0])
+        dictionary_of_occurrences = {c: len(self._positions[c]) for c in characters}
+        # adding the characters to a set in order of first occurrence gives the same set as set(text), hence the same
+        # order as in short_solution()
+        list_of_characters = list(set(iter(characters)))
+        return (len(self), list_of_characters, dictionary_of_occurrences,
+                attributes_from_occurrences(dictionary_of_occurrences))
+
+
 def list_of_characters_using_list(target: str) -> List[str]:
     # initialize as empty list
     list_of_characters = []
@@ -123,17 +357,167 @@ def dictionary_of_occurrences_direct_defaultdict(target: str) -> Dict[str, int]:
     return dictionary_of_occurrences
 
 
-def time_it(code: Callable, cycles: Optional[int] = 100000) -> float:
+def dictionary_of_occurrences_bytes(target: str) -> Dict[str, int]:
+    """
+    Fast path for texts which only contain ASCII/Latin-1 characters: the text is encoded to bytes once and the
+    histogram is calculated in a single vectorized pass (numpy.bincount) instead of counting character by character
+    in Python. Other texts are counted using Counter.
+    :param target: text
+    :return: dictionary of occurrences in order of first occurrence
+    """
+    try:
+        data = target.encode('latin-1')
+    except UnicodeEncodeError:
+        return dict(Counter(target))
+    if numpy is not None:
+        histogram = numpy.bincount(numpy.frombuffer(data, dtype=numpy.uint8), minlength=256)
+        present = numpy.flatnonzero(histogram).tolist()
+        histogram = histogram.tolist()
+    else:
+        present = set(data)
+        histogram = {b: data.count(b) for b in present}
+    # keep the order of first occurrence like Counter does
+    return {chr(b): histogram[b] for b in sorted(present, key=data.index)}
+
+
+# variants to benchmark: name and function taking the text as only parameter
+VARIANTS: List[Tuple[str, Callable[[str], Any]]] = [
+    ('list_of_characters_using_list', list_of_characters_using_list),
+    ('list_of_characters_using_list_no_for', list_of_characters_using_list_no_for),
+    ('list_of_characters_using_list_avoid_in', list_of_characters_using_list_avoid_in),
+    ('list(set(target))', lambda target: list(set(target))),
+    ('dictionary_of_occurrences_direct', dictionary_of_occurrences_direct),
+    ('dictionary_of_occurrences_direct_try', dictionary_of_occurrences_direct_try),
+    ('dictionary_of_occurrences_direct_using_get', dictionary_of_occurrences_direct_using_get),
+    ('dictionary_of_occurrences_direct_defaultdict', dictionary_of_occurrences_direct_defaultdict),
+    ('dict(Counter(target))', lambda target: dict(Counter(target))),
+    ('dictionary_of_occurrences_bytes', dictionary_of_occurrences_bytes),
+]
+
+# alphabets for the random benchmark texts
+ALPHABETS = {
+    'ascii': ascii_lowercase + ' .,-',
+    'unicode': ascii_lowercase + ' .,-äöüßéèçñøå€αβγδεжзий😀',
+}
+
+BENCHMARK_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+
+
+def random_text(alphabet: str, size: int, block_size: int = 1_000_000) -> str:
+    """
+    Create a random text
+    :param alphabet: characters to use
+    :param size: number of characters
+    :param block_size: the text is created in blocks of this size to limit temporary memory
+    :return: text
     """
-    Execute some code a number of times and measure the time
+    return ''.join(''.join(choices(alphabet, k=min(block_size, size - offset)))
+                   for offset in range(0, size, block_size))
+
+
+def benchmark(code: Callable[[], Any], repeats: int = 7, warmup: int = 1, min_sample_ns: int = 20_000_000) -> \
+        Dict[str, float]:
+    """
+    Measure the execution time of some code.
+    The number of loops per sample is calibrated so that each sample takes at least min_sample_ns. After the warmup
+    samples the given number of samples is taken.
     :param code: code to execute
-    :param cycles: number of cycles
-    :return: seconds per execution
+    :param repeats: number of samples
+    :param warmup: number of samples to discard before measuring
+    :param min_sample_ns: minimum duration of a sample
+    :return: statistics in ns per execution: median, p95, stdev, min, max; number of loops per sample
+    """
+
+    def sample(loops: int) -> int:
+        start = perf_counter_ns()
+        for _ in range(loops):
+            code()
+        return perf_counter_ns() - start
+
+    loops = 1
+    while (duration := sample(loops)) < min_sample_ns:
+        # scale up based on the last sample
+        loops = max(loops * 2, int(loops * min_sample_ns / max(duration, 1) * 1.2))
+    for _ in range(warmup):
+        sample(loops)
+    times = sorted(sample(loops) / loops for _ in range(max(1, repeats)))
+    return {'loops': loops,
+            'median_ns': statistics.median(times),
+            'p95_ns': times[min(len(times) - 1, round(0.95 * (len(times) - 1)))],
+            'stdev_ns': statistics.stdev(times) if len(times) > 1 else 0.0,
+            'min_ns': times[0],
+            'max_ns': times[-1]}
+
+
+def run_benchmarks(sizes: Tuple[int, ...] = BENCHMARK_SIZES, alphabets: Tuple[str, ...] = tuple(ALPHABETS),
+                   variants: Optional[List[str]] = None, repeats: int = 7, warmup: int = 1,
+                   max_seconds: float = 10.0) -> Dict[str, Any]:
+    """
+    Benchmark the variants for all combinations of text size and alphabet
+    :param sizes: text sizes
+    :param alphabets: names of alphabets (see ALPHABETS)
+    :param variants: names of the variants to benchmark; default: all
+    :param repeats: number of samples per benchmark
+    :param warmup: number of warmup samples per benchmark
+    :param max_seconds: a variant taking longer than this for a single execution is not benchmarked for larger sizes
+    :return: benchmark results: environment and list of results
+    """
+    selected = [(name, f) for name, f in VARIANTS if variants is None or name in variants]
+    results = []
+    for alphabet in alphabets:
+        too_slow = set()
+        for size in sorted(sizes):
+            target = random_text(ALPHABETS[alphabet], size)
+            for name, f in selected:
+                if name in too_slow:
+                    continue
+                result = benchmark(lambda: f(target), repeats=repeats, warmup=warmup)
+                results.append({'variant': name, 'alphabet': alphabet, 'size': size, **result})
+                print(f'{name} [{alphabet}, {size}]: median {result["median_ns"] / 1000:.03f} us, '
+                      f'p95 {result["p95_ns"] / 1000:.03f} us, stdev {result["stdev_ns"] / 1000:.03f} us',
+                      file=sys.stderr)
+                if result['median_ns'] > max_seconds * 1e9:
+                    too_slow.add(name)
+    return {'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': numpy is not None,
+            'results': results}
+
+
+def compare_benchmarks(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1) -> \
+        List[Dict[str, Any]]:
+    """
+    Compare two benchmark runs
+    :param baseline: results of the baseline run
+    :param current: results of the current run
+    :param threshold: relative change of the median which is considered a regression (or improvement)
+    :return: list of comparisons for all benchmarks in both runs with baseline and current median, relative change
+        and a status: 'regression', 'improvement' or 'ok'
     """
-    start = time()
-    for _ in range(cycles):
-        code()
-    return (time() - start) / cycles
+
+    def key(r: Dict[str, Any]) -> Tuple[str, str, int]:
+        return r['variant'], r['alphabet'], r['size']
+
+    baseline_results = {key(r): r for r in baseline['results']}
+    comparison = []
+    for r in current['results']:
+        b = baseline_results.get(key(r))
+        if b is None:
+            continue
+        change = r['median_ns'] / b['median_ns'] - 1
+        # only flag changes which are bigger than the noise of both runs
+        noise = (b['stdev_ns'] + r['stdev_ns']) / b['median_ns']
+        if change > max(threshold, noise):
+            status = 'regression'
+        elif change < -max(threshold, noise):
+            status = 'improvement'
+        else:
+            status = 'ok'
+        comparison.append({'variant': r['variant'], 'alphabet': r['alphabet'], 'size': r['size'],
+                           'baseline_ns': b['median_ns'], 'current_ns': r['median_ns'], 'change': change,
+                           'status': status})
+    return comparison
 
 
 if __name__ == '__main__':
@@ -150,8 +534,8 @@ if __name__ == '__main__':
         'u': ('odd', 1), '0': (3, 'odd'), '4': ('odd', 1), '.': (1, 'odd')}
         
         Timing some alternatives...
-        list_of_characters_using_lists: 285.922 us
-        list_of_characters_using_lists_no_for: 248.089 us
+        list_of_characters_using_list: 285.922 us
+        list_of_characters_using_list_no_for: 248.089 us
         list_of_characters_using_list_avoid_in: 44.528 us
         list(set(target)): 15.462 us
         
@@ -160,6 +544,7 @@ if __name__ == '__main__':
         dictionary_of_occurrences_direct_using_get: 113.266 us
         dictionary_of_occurrences_direct_defaultdict: 83.405 us
         dict(Counter(target)): 53.148 us
+        dictionary_of_occurrences_bytes: 24.102 us
     
     Clearly shows:
         * iterating over a string is more efficient than slicign out the individual characters
@@ -167,8 +552,81 @@ if __name__ == '__main__':
         * implementation of dict access in Python is very efficient
         * exception handling is very efficient; actually in some cases cheaper than explicit error avoidance code
         * tyring to use Python internals (set, Counter, ..) pays off
+        * vectorized counting on bytes beats any per character counting; the gain grows with the size of the text
 
     """
+    parser = argparse.ArgumentParser(description='Character statistics')
+    parser.add_argument('file', nargs='?', help='UTF-8 file to calculate the statistics for; - for stdin')
+    parser.add_argument('--workers', type=int,
+                        help='read the whole file and use this number of processes to calculate the statistics')
+    parser.add_argument('--window', type=int,
+                        help='read lines from stdin and print the statistics for the last WINDOW characters (whole '
+                             'lines) after each line')
+    parser.add_argument('--benchmark', action='store_true', help='run the benchmark suite')
+    parser.add_argument('--sizes', type=float, nargs='+', default=BENCHMARK_SIZES,
+                        help='text sizes for the benchmark, e.g. 1e3 1e6 1e8')
+    parser.add_argument('--alphabets', nargs='+', choices=ALPHABETS, default=list(ALPHABETS),
+                        help='alphabets for the benchmark')
+    parser.add_argument('--variants', nargs='+', choices=[name for name, _ in VARIANTS], help='variants to benchmark')
+    parser.add_argument('--repeats', type=int, default=7, help='number of samples per benchmark')
+    parser.add_argument('--warmup', type=int, default=1, help='number of warmup samples per benchmark')
+    parser.add_argument('--output', metavar='FILE', help='write benchmark results to a JSON file')
+    parser.add_argument('--compare', metavar='FILE', nargs='+',
+                        help='BASELINE [CURRENT]: compare benchmark results; without CURRENT the benchmark is run')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change of the median flagged as regression')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='record call counts and latencies of the statistics functions, written to FILE on exit')
+    parser.add_argument('--metrics-format', choices=('json', 'prometheus'), default='json',
+                        help='format of the metrics file')
+    parser.add_argument('--profile', metavar='FILE', help='profile the run with cProfile, statistics are written to '
+                                                          'FILE on exit')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enabled = True
+        atexit.register(metrics.export, args.metrics, args.metrics_format)
+    if args.profile:
+        start_profile(args.profile)
+
+    if args.window:
+        stats = CharStats()
+        lines = deque()
+        for line in sys.stdin:
+            stats.feed(line)
+            lines.append(line)
+            while len(stats) > args.window:
+                stats.evict(lines.popleft())
+            print_statistics(*stats.snapshot())
+        parser.exit()
+
+    if args.benchmark or args.compare:
+        if args.compare and len(args.compare) > 1:
+            with open(args.compare[1]) as f:
+                results = json.load(f)
+        else:
+            results = run_benchmarks(sizes=tuple(int(size) for size in args.sizes), alphabets=tuple(args.alphabets),
+                                     variants=args.variants, repeats=args.repeats, warmup=args.warmup)
+        if args.output:
+            with open(args.output, mode='w') as f:
+                json.dump(results, f, indent=2)
+        regressions = 0
+        if args.compare:
+            with open(args.compare[0]) as f:
+                baseline = json.load(f)
+            for c in compare_benchmarks(baseline, results, threshold=args.threshold):
+                regressions += c['status'] == 'regression'
+                print(f'{c["variant"]} [{c["alphabet"]}, {c["size"]}]: {c["baseline_ns"] / 1000:.03f} us -> '
+                      f'{c["current_ns"] / 1000:.03f} us ({c["change"]:+.1%}) {c["status"]}')
+        elif not args.output:
+            print(json.dumps(results, indent=2))
+        parser.exit(1 if regressions else 0)
+    if args.file:
+        if args.workers:
+            print_statistics(*parallel_statistics(args.file, workers=args.workers))
+        else:
+            print_statistics(*file_statistics(args.file))
+        parser.exit()
+
     # the short solution
     target_str = 'try to solve that challenge - just get a try 0004.'
     short_solution(target=target_str)
@@ -178,33 +636,7 @@ if __name__ == '__main__':
     print()
     print('Timing some alternatives...')
     target_str = ''.join(choices(ascii_lowercase, k=1000))
-    print(
-        f'list_of_characters_using_lists: '
-        f'{time_it(lambda: list_of_characters_using_list(target_str)) * 1000000:.03f} us')
-    print(
-        f'list_of_characters_using_lists_no_for: '
-        f'{time_it(lambda: list_of_characters_using_list_no_for(target_str)) * 1000000:.03f} us')
-    print(
-        f'list_of_characters_using_list_avoid_in: '
-        f'{time_it(lambda: list_of_characters_using_list_avoid_in(target_str)) * 1000000:.03f} us')
-    print(
-        f'list(set(target)): '
-        f'{time_it(lambda: list(set(target_str))) * 1000000:.03f} us')
-
-    print()
-
-    print(
-        f'dictionary_of_occurrences_direct: '
-        f'{time_it(lambda: dictionary_of_occurrences_direct(target_str)) * 1000000:.03f} us')
-    print(
-        f'dictionary_of_occurrences_direct_try: '
-        f'{time_it(lambda: dictionary_of_occurrences_direct_try(target_str)) * 1000000:.03f} us')
-    print(
-        f'dictionary_of_occurrences_direct_using_get: '
-        f'{time_it(lambda: dictionary_of_occurrences_direct_using_get(target_str)) * 1000000:.03f} us')
-    print(
-        f'dictionary_of_occurrences_direct_defaultdict: '
-        f'{time_it(lambda: dictionary_of_occurrences_direct_defaultdict(target_str)) * 1000000:.03f} us')
-    print(
-        f'dict(Counter(target)): '
-        f'{time_it(lambda: dict(Counter(target_str))) * 1000000:.03f} us')
+    for variant_name, variant in VARIANTS:
+        if variant_name == 'dictionary_of_occurrences_direct':
+            print()
+        print(f'{variant_name}: {benchmark(lambda: variant(target_str))["median_ns"] / 1000:.03f} us')
@@ -0,0 +1,113 @@
+"""
+Opt-in instrumentation for the character statistics: call counts and latency histograms of selected functions and a
+cProfile hook.
+"""
+import atexit
+import json
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional
+
+
+class Metrics:
+    """
+    Call counts and latency histograms of the functions decorated with instrumented(). Disabled by default: while
+    disabled the decorated functions only check the enabled flag.
+    """
+    # upper bounds of the latency buckets in seconds; the last bucket takes everything above
+    BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+    def __init__(self):
+        self.enabled = False
+        # function name -> [number of calls, total seconds, number of calls per bucket]
+        self.functions: Dict[str, list] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        entry = self.functions.get(name)
+        if entry is None:
+            entry = self.functions[name] = [0, 0.0, [0] * (len(self.BUCKETS) + 1)]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2][bisect_left(self.BUCKETS, seconds)] += 1
+
+    def to_json(self) -> Dict[str, Any]:
+        bounds = [str(b) for b in self.BUCKETS] + ['+Inf']
+        return {name: {'calls': calls, 'seconds': seconds, 'buckets': dict(zip(bounds, buckets))}
+                for name, (calls, seconds, buckets) in sorted(self.functions.items())}
+
+    def to_prometheus(self, prefix: str = 'charstats') -> str:
+        """
+        Metrics in the Prometheus text format: one histogram with the function name as label
+        :param prefix: prefix of the metric name
+        :return: text
+        """
+        metric = f'{prefix}_function_duration_seconds'
+        lines = [f'# HELP {metric} Duration of instrumented function calls', f'# TYPE {metric} histogram']
+        bounds = [str(b) for b in self.BUCKETS] + ['+Inf']
+        for name, (calls, seconds, buckets) in sorted(self.functions.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, buckets):
+                # Prometheus buckets are cumulative
+                cumulative += count
+                lines.append(f'{metric}_bucket{{function="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{function="{name}"}} {seconds}')
+            lines.append(f'{metric}_count{{function="{name}"}} {calls}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: str, fmt: str = 'json') -> None:
+        """
+        Write the metrics to a file
+        :param path: file
+        :param fmt: 'json' or 'prometheus'
+        :return: None
+        """
+        with open(path, mode='w') as f:
+            if fmt == 'prometheus':
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, indent=2)
+
+
+metrics = Metrics()
+
+
+def instrumented(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """
+    Decorator recording call count and latency of a function in metrics while metrics are enabled. The variants compared
+    by the benchmarks are not instrumented: the benchmarks time them already. Only calls in this process are recorded.
+    :param name: name to record the calls under; default: qualified name of the function
+    :return: decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        label = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(label, perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def start_profile(path: str) -> None:
+    """
+    Profile the rest of the run with cProfile. The statistics are written to a file on exit (see pstats).
+    :param path: file for the statistics
+    :return: None
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+
+    def stop() -> None:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+    atexit.register(stop)
+    profiler.enable()
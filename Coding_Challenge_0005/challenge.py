@@ -30,280 +30,2018 @@ maybe when asking specific question to user or when confirming to user that the
 Feel free to beautify. You can find that external module (colored) and its detailed usage at this link
 https://pypi.org/project/colored/
 """
+import argparse
+import atexit
+import hashlib
+import importlib.util
+import json
+import mmap
+import os
+import struct
+import sys
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+from types import ModuleType
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple, Type, Union
 
-import logging
-import datetime
-import re
-import uuid
-from typing import List, Optional, Any, get_args, get_origin
+from instrumentation import instrumented, metrics, start_profile
 
-from pydantic import BaseModel, Field, EmailStr, ValidationError, validator
-from pydantic.fields import ModelField
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locks on this platform (Windows): concurrent writers are not supported
+    fcntl = None
 
 USER_FILE = 'users-records.json'
-DATE_FORMAT = '%d-%m-%Y'
 
-def choice(prompt: str, options: str) -> str:
-    options = list(options)
-    while (r := input(prompt).lower()) not in options:
-        pass
-    return r
 
+def lazy_import(name: str) -> ModuleType:
+    """
+    Import a module when one of its attributes is accessed first
+    :param name: module name
+    :return: module
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
 
-def yes_no(prompt: str):
-    return choice(prompt, 'yn') == 'y'
 
+# pydantic takes longer to import than counting or looking up users: the models are imported on first use
+models = lazy_import('models')
 
-class InputMixin:
+
+def write_all(file: BinaryIO, data: bytes) -> None:
     """
-    Mixin to add capability to add an object from the console via the from_console class method
+    Write data to an unbuffered file. Unbuffered writes can be partial; write until all data has been written.
+    :param file: unbuffered file
+    :param data: data to write
+    :return: None
     """
-    def log_created(self):
-        pass
+    view = memoryview(data)
+    while view:
+        view = view[file.write(view):]
 
-    @classmethod
-    def list_from_console(cls, name: str, values=None):
-        values = values or []
-        print(f'{name}: enter list of {cls.__name__} objects')
-        index = 0
-        while True:
-            index += 1
-            print(f'--{cls.__name__} #{index}--')
-            if len(values) >= index:
-                edit_value = values[index - 1]
-            else:
-                edit_value = None
-            v = cls.from_console(current_value=edit_value)
-            if v is None:
-                index -= 1
-            elif len(values) >= index:
-                values[index - 1] = v
-            else:
-                values.append(v)
-            if yes_no(f'Enter further {cls.__name__} objects? (Y/N)'):
-                continue
-            break
-        if index:
-            values = values[:index]
-        else:
-            values = []
-        return values
 
-    @classmethod
-    def from_console(cls, current_value=None):
+def normalize_email(email: str) -> str:
+    """
+    Normalize an email address like EmailStr does: the local part is kept as is, the domain is converted to lower case
+    :param email: (validated) email address
+    :return: normalized email address
+    """
+    local_part, _, domain = email.strip().rpartition('@')
+    return f'{local_part}@{domain.lower()}'
+
+
+# lookup table of an index file (see UserIndex.write_lookup()): header followed by entries sorted by id hash and the
+# offsets of all entries in ascending order
+LOOKUP_MAGIC = b'UIDXLKP2'
+# magic, inode of the index file, position in the index file and size of the user file covered, number of entries
+LOOKUP_HEADER = struct.Struct('>8sQQQQ')
+# hash of the user id, offset and length of the record; big-endian, so the packed entries sort by hash
+LOOKUP_ENTRY = struct.Struct('>8sQQ')
+LOOKUP_OFFSET = struct.Struct('>Q')
+# the lookup table is written again once the index file has grown by this many bytes and by a quarter
+LOOKUP_MIN_DELTA = 1024 * 1024
+
+
+def id_hash(user_id: str) -> bytes:
+    """
+    Hash of a user id for the lookup table. Unlike hash() it's the same in all processes.
+    :param user_id: user id
+    :return: 8 byte hash
+    """
+    return hashlib.blake2b(user_id.encode(), digest_size=8).digest()
+
+
+class UserIndex:
+    """
+    Index of a user file: maps each user id to offset and length of the record in the file and each (normalized) email
+    address to the id of the user the address has been recorded for last.
+    The index is persisted in a sidecar file next to the user file (one "id offset length email" line per record).
+    Readers which only look up a few ids don't need to load the index: a lookup table sorted by id hash is kept next to
+    the index file (see UserLookup).
+
+    Several processes can share the index file. Reading the index (load(), refresh()) never changes any file. Methods
+    writing to the index file (catch_up(), add(), rebuild()) must only be called while holding the store lock (see
+    UserStore.lock()).
+    """
+
+    def __init__(self, path: str):
         """
-        Input object from console and
-        :return: object or None if input failed
+        :param path: user file to index
         """
-        print(f'Enter values for new {cls.__name__} object')
-        obj = None
-        if current_value is not None:
-            assert isinstance(current_value, cls)
-            values = {k: current_value.__dict__[k] for k in cls.__fields__}
-        else:
-            values = dict()
-        while True:
-            for name, field in cls.__fields__.items():
-                field: ModelField
-                if field.default:
-                    # no need to edit this value
-                    continue
-                if field.field_info.extra.get('no_edit'):
-                    # no need to edit this value
-                    continue
-                current_value = values.get(name)
-                # check if this is a generic (List)
-                ot = field.outer_type_
-                args = get_args(ot)
-                if args:
-                    # this is a generic type
-                    # we only support lists of InputMixin subclasses
-                    origin = get_origin(ot)
-                    if origin == list and issubclass(args[0], InputMixin):
-                        v = args[0].list_from_console(name=name, values=current_value)
-                    else:
-                        raise NotImplementedError
-                else:
-                    if current_value is not None:
-                        # already have a value
-                        # prompt with value and offer option to enter empty string to keep current value
-                        v = input(f'{cls.__name__}.{name} ({current_value}), ENTER to keep: ')
-                        v = v or current_value
+        self.path = path
+        self.index_path = f'{path}.idx'
+        self.lookup_path = f'{self.index_path}.lookup'
+        self._file = None
+        self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def superseded(self) -> int:
+        """
+        Number of records in the user file which have been replaced by a later record of the same user
+        """
+        return self.records - len(self.entries)
+
+    def __contains__(self, user_id: str):
+        return user_id in self.entries
+
+    def get(self, user_id: str) -> Optional[Tuple[int, int]]:
+        """
+        Get location of a user record
+        :param user_id: user id
+        :return: (offset, length) or None if the id isn't indexed
+        """
+        return self.entries.get(user_id)
+
+    def email_owner(self, email: str) -> Optional[str]:
+        """
+        Get the user an email address has been recorded for last. The user might have changed the address since.
+        :param email: normalized email address
+        :return: user id or None if the address isn't indexed
+        """
+        return self.emails.get(email)
+
+    def _reset(self, inode: Optional[int] = None) -> None:
+        self.entries = {}
+        self.emails = {}
+        # index file written by an earlier version without email addresses: has to be re-built
+        self.legacy = False
+        # size of the user file covered by the index
+        self.covered = 0
+        # number of records indexed, including superseded ones
+        self.records = 0
+        # position in the index file up to which entries have been read
+        self._position = 0
+        # inode of the index file the entries have been read from
+        self._inode = inode
+        # position in the index file covered by the lookup table; None: not known yet
+        self._lookup_position = None
+
+    def load(self) -> None:
+        """
+        Read the index from the sidecar file
+        :return: None
+        """
+        self._reset()
+        self.refresh()
+
+    def refresh(self) -> List[Tuple[str, int, int, str]]:
+        """
+        Read the entries added to the index file since the index file was last read. If the index file has been
+        replaced in the meantime (see rebuild()) the complete index is read again.
+        :return: list of entries (id, offset, length, email) added to the index
+        """
+        added = []
+        try:
+            with open(self.index_path, mode='rb') as index_file:
+                inode = os.fstat(index_file.fileno()).st_ino
+                if inode != self._inode:
+                    # read the replaced index again: all its entries are reported
+                    self._reset(inode)
+                index_file.seek(self._position)
+                for line in index_file:
+                    if not line.endswith(b'\n'):
+                        # incomplete entry
+                        break
+                    self._position += len(line)
+                    try:
+                        # the email address is the last field: it can contain spaces (quoted local part)
+                        user_id, offset, length, *email = line.decode().rstrip('\n').split(' ', 3)
+                        offset = int(offset)
+                        length = int(length)
+                    except ValueError:
+                        continue
+                    if email:
+                        email = email[0]
+                        self.emails[email] = user_id
                     else:
-                        v = input(f'{cls.__name__}.{name}:')
-                values[name] = v
+                        email = ''
+                        self.legacy = True
+                    self.entries[user_id] = (offset, length)
+                    self.records += 1
+                    self.covered = max(self.covered, offset + length)
+                    added.append((user_id, offset, length, email))
+        except FileNotFoundError:
+            self._reset()
+        return added
+
+    def catch_up(self, size: int) -> List[Tuple[str, int, int, str]]:
+        """
+        Make sure that the index covers the complete user file. Requires the store lock.
+        :param size: size of the user file
+        :return: list of entries (id, offset, length, email) added to the index
+        """
+        added = self.refresh()
+        if self.covered > size or self.legacy:
+            # user file got shorter or index without email addresses: index is invalid
+            self.rebuild()
+            return []
+        if self._file is not None and os.fstat(self._file.fileno()).st_ino != self._inode:
+            # index file has been replaced
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            self._file = open(self.index_path, mode='ab', buffering=0)
+            self._inode = os.fstat(self._file.fileno()).st_ino
+        if self._file.seek(0, os.SEEK_END) > self._position:
+            # incomplete entry left behind by a crash
+            self._file.truncate(self._position)
+        if self.covered < size:
+            scanned = list(self._scan(self.covered))
+            self.add(scanned)
+            added.extend(scanned)
+        return added
+
+    def _scan(self, start: int) -> Iterator[Tuple[str, int, int, str]]:
+        """
+        Read the records from the user file
+        :param start: offset to start reading at
+        :return: generator of entries (id, offset, length, email)
+        """
+        try:
+            with open(self.path, mode='rb') as user_file:
+                user_file.seek(start)
+                offset = start
+                for line in user_file:
+                    if not line.endswith(b'\n'):
+                        # incomplete record
+                        break
+                    if line.strip():
+                        try:
+                            values = json.loads(line)
+                            yield values['id'], offset, len(line), normalize_email(values['email'])
+                        except (ValueError, KeyError, TypeError, AttributeError):
+                            pass
+                    offset += len(line)
+        except FileNotFoundError:
+            pass
+
+    def add(self, entries: List[Tuple[str, int, int, str]]) -> None:
+        """
+        Add records to the index. Requires the store lock.
+        :param entries: list of entries (id, offset, length, email): offset of the record in the user file, length of
+            the record in bytes including the newline and normalized email address
+        :return: None
+        """
+        if not entries:
+            return
+        data = ''.join(f'{user_id} {offset} {length} {email}\n' for user_id, offset, length, email in entries).encode()
+        write_all(self._file, data)
+        self._position += len(data)
+        self.records += len(entries)
+        for user_id, offset, length, email in entries:
+            self.entries[user_id] = (offset, length)
+            self.emails[email] = user_id
+            self.covered = max(self.covered, offset + length)
+        if self._lookup_position is None:
+            self._lookup_position = self._read_lookup_position()
+        if self._lookup_outdated():
+            # another process might have written the lookup table in the meantime
+            self._lookup_position = self._read_lookup_position()
+            if self._lookup_outdated():
+                self.write_lookup()
+
+    def _lookup_outdated(self) -> bool:
+        # re-writing the table costs time proportional to the number of users: the more users the less often
+        delta = self._position - self._lookup_position
+        return delta >= LOOKUP_MIN_DELTA and delta >= self._lookup_position // 4
+
+    def _read_lookup_position(self) -> int:
+        """
+        Get the position in the index file up to which the lookup table covers the index
+        :return: position; 0 if there is no lookup table for the current index file
+        """
+        try:
+            with open(self.lookup_path, mode='rb') as lookup_file:
+                magic, inode, position, _, _ = LOOKUP_HEADER.unpack(lookup_file.read(LOOKUP_HEADER.size))
+        except (FileNotFoundError, struct.error):
+            return 0
+        return position if magic == LOOKUP_MAGIC and inode == self._inode else 0
+
+    def write_lookup(self) -> None:
+        """
+        Write the lookup table for the entries read so far. The table is written to a temporary file which then
+        replaces the table. Requires the store lock.
+        :return: None
+        """
+        # sorting the packed entries is faster than sorting tuples
+        entries = sorted(LOOKUP_ENTRY.pack(id_hash(user_id), offset, length)
+                         for user_id, (offset, length) in self.entries.items())
+        offsets = sorted(offset for offset, _ in self.entries.values())
+        temp_path = f'{self.lookup_path}.tmp'
+        with open(temp_path, mode='wb') as temp:
+            temp.write(LOOKUP_HEADER.pack(LOOKUP_MAGIC, self._inode, self._position, self.covered, len(entries)))
+            temp.write(b''.join(entries))
+            temp.write(struct.pack(f'>{len(offsets)}Q', *offsets))
+        os.replace(temp_path, self.lookup_path)
+        self._lookup_position = self._position
+
+    def rebuild(self) -> None:
+        """
+        Re-build the index from scratch. The new index is written to a temporary file which then replaces the index
+        file, so that other processes always see a complete index. Requires the store lock.
+        :return: None
+        """
+        self.close()
+        temp_path = f'{self.index_path}.tmp'
+        with open(temp_path, mode='w') as temp:
+            temp.writelines(f'{user_id} {offset} {length} {email}\n'
+                            for user_id, offset, length, email in self._scan(0))
+        os.replace(temp_path, self.index_path)
+        self.load()
+        self._file = open(self.index_path, mode='ab', buffering=0)
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self.write_lookup()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class UserLookup:
+    """
+    Read single user records by id and count users without loading the index (see UserIndex) and without taking the
+    store lock, so lookups cost the same for any number of users and never wait for writers.
+
+    The id is searched in three places, newest first:
+    * records appended to the user file which haven't been indexed yet
+    * entries added to the index file after the lookup table has been written: searched in the index file itself
+    * the lookup table: fixed size (hash of id, offset, length) entries sorted by hash, bisected through a memory map
+    """
+
+    def __init__(self, path: str = USER_FILE):
+        """
+        :param path: user file
+        """
+        self.path = path
+        self.index_path = f'{path}.idx'
+        self.lookup_path = f'{self.index_path}.lookup'
+
+    @contextmanager
+    def _snapshot(self) -> Iterator[Tuple[Optional[mmap.mmap], int, bytes, int, int]]:
+        """
+        Open the lookup table and read the index entries added after the table has been written
+        :return: context manager yielding a tuple of memory map of the table (None if there is no valid table), number
+            of entries in the table, index entries not in the table (starting with a newline), position of the newline
+            after the last complete entry and size of the user file covered by the index
+        """
+        table = None
+        position = covered = count = 0
+        try:
+            index_file = open(self.index_path, mode='rb')
+        except FileNotFoundError:
+            index_file = None
+        try:
+            if index_file is not None:
+                inode = os.fstat(index_file.fileno()).st_ino
+                try:
+                    with open(self.lookup_path, mode='rb') as lookup_file:
+                        magic, table_inode, table_position, table_covered, table_count = LOOKUP_HEADER.unpack(
+                            lookup_file.read(LOOKUP_HEADER.size))
+                        if magic == LOOKUP_MAGIC and table_inode == inode:
+                            position, covered = table_position, table_covered
+                            if table_count and os.fstat(lookup_file.fileno()).st_size >= \
+                                    LOOKUP_HEADER.size + table_count * (LOOKUP_ENTRY.size + LOOKUP_OFFSET.size):
+                                table = mmap.mmap(lookup_file.fileno(), 0, access=mmap.ACCESS_READ)
+                                count = table_count
+                except (FileNotFoundError, struct.error):
+                    pass
+                index_file.seek(position)
+                # only complete entries count: an entry might still be written
+                delta = b'\n' + index_file.read()
+            else:
+                delta = b'\n'
+            end = delta.rfind(b'\n')
+            if end:
+                last = delta[delta.rfind(b'\n', 0, end) + 1:end].split(b' ', 3)
+                try:
+                    covered = int(last[1]) + int(last[2])
+                except (ValueError, IndexError):
+                    pass
+            yield table, count, delta, end, covered
+        finally:
+            if table is not None:
+                table.close()
+            if index_file is not None:
+                index_file.close()
+
+    def locations(self, user_id: str) -> List[Tuple[int, int]]:
+        """
+        Find the location of the latest record of a user. A location has to be checked by reading the record: the user
+        file might just have been replaced by a compaction, and ids can share a hash.
+        :param user_id: id of the user
+        :return: list of (offset, length) to try in this order; empty if the user isn't known
+        """
+        with self._snapshot() as (table, count, delta, end, covered):
+            location = self._scan(user_id, covered)
+            if location is not None:
+                return [location]
+            start = delta.rfind(b'\n' + user_id.encode() + b' ', 0, end)
+            if start >= 0:
+                entry = delta[start + 1:delta.index(b'\n', start + 1)].split(b' ', 3)
+                try:
+                    return [(int(entry[1]), int(entry[2]))]
+                except (ValueError, IndexError):
+                    pass
+            if table is None:
+                return []
+            return self._search(table, count, id_hash(user_id))
+
+    def _recent(self, delta: bytes, end: int, covered: int) -> Dict[str, Tuple[int, int]]:
+        """
+        Locations of the records added after the lookup table has been written
+        :param delta: index entries not in the table
+        :param end: end of the last complete entry
+        :param covered: size of the user file covered by the index
+        :return: dictionary user id -> (offset, length) of the latest record
+        """
+        recent = {}
+        for entry in delta[1:end].split(b'\n'):
+            fields = entry.split(b' ', 3)
             try:
-                obj = cls(**values)
-            except ValidationError as e:
-                print('Invalid input')
-                for error in e.raw_errors:
-                    print(f'{error._loc}: input=\'{values[error._loc]}\', error: {error.exc}')
-                if not yes_no('Re-enter? (Y/N)'):
-                    break
+                recent[fields[0].decode()] = (int(fields[1]), int(fields[2]))
+            except (ValueError, IndexError):
+                pass
+        for user_id, offset, length in self._records(covered):
+            recent[user_id] = (offset, length)
+        return recent
+
+    def __len__(self) -> int:
+        """
+        Number of users: each user is counted once, however many records have been written for the user
+        :return: number of users
+        """
+        with self._snapshot() as (table, count, delta, end, covered):
+            recent = self._recent(delta, end, covered)
+            return count + sum(1 for user_id in recent
+                               if table is None or not self._search(table, count, id_hash(user_id)))
+
+    @contextmanager
+    def latest(self) -> Iterator[Callable[[str, int], bool]]:
+        """
+        Check records read from the user file in the order of the file: is a record the latest one of its user? The
+        ascending offsets of the records in the lookup table are walked alongside, so each check costs constant time.
+        :return: context manager yielding a function (user id, offset of the record) -> True if it's the latest record
+        """
+        with self._snapshot() as (table, count, delta, end, covered):
+            recent = self._recent(delta, end, covered)
+            offsets = LOOKUP_HEADER.size + count * LOOKUP_ENTRY.size
+            # position in the offsets of the table
+            position = 0
+
+            def is_latest(user_id: str, offset: int) -> bool:
+                nonlocal position
+                location = recent.get(user_id)
+                if location is not None:
+                    return location[0] == offset
+                if table is None:
+                    return True
+                while position < count and LOOKUP_OFFSET.unpack_from(
+                        table, offsets + position * LOOKUP_OFFSET.size)[0] < offset:
+                    position += 1
+                return position < count and LOOKUP_OFFSET.unpack_from(
+                    table, offsets + position * LOOKUP_OFFSET.size)[0] == offset
+
+            yield is_latest
+
+    @staticmethod
+    def _search(table: mmap.mmap, count: int, key: bytes) -> List[Tuple[int, int]]:
+        """
+        Bisect the lookup table for a hash
+        :param table: memory map of the lookup table file
+        :param count: number of entries in the table
+        :param key: id hash
+        :return: list of (offset, length) of the entries with that hash
+        """
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if LOOKUP_ENTRY.unpack_from(table, LOOKUP_HEADER.size + middle * LOOKUP_ENTRY.size)[0] < key:
+                low = middle + 1
             else:
+                high = middle
+        locations = []
+        for i in range(low, count):
+            entry_hash, offset, length = LOOKUP_ENTRY.unpack_from(table, LOOKUP_HEADER.size + i * LOOKUP_ENTRY.size)
+            if entry_hash != key:
                 break
-        if obj:
-            obj.log_created()
-        return obj
+            locations.append((offset, length))
+        return locations
 
+    def _scan(self, user_id: str, start: int) -> Optional[Tuple[int, int]]:
+        """
+        Search the records appended to the user file after the indexed part
+        :param user_id: id of the user
+        :param start: size of the user file covered by the index
+        :return: (offset, length) of the latest record of the user or None
+        """
+        location = None
+        # cheap check before parsing a record; JSON escapes non-ASCII characters in different ways
+        key = json.dumps(user_id).encode() if user_id.isascii() else None
+        try:
+            with open(self.path, mode='rb') as user_file:
+                user_file.seek(start)
+                offset = start
+                for line in user_file:
+                    if not line.endswith(b'\n'):
+                        break
+                    if key is None or key in line:
+                        try:
+                            if json.loads(line)['id'] == user_id:
+                                location = (offset, len(line))
+                        except (ValueError, KeyError, TypeError):
+                            pass
+                    offset += len(line)
+        except FileNotFoundError:
+            pass
+        return location
+
+    def _records(self, start: int) -> Iterator[Tuple[str, int, int]]:
+        """
+        Read the records appended to the user file after the indexed part
+        :param start: size of the user file covered by the index
+        :return: generator of (user id, offset, length)
+        """
+        try:
+            with open(self.path, mode='rb') as user_file:
+                user_file.seek(start)
+                offset = start
+                for line in user_file:
+                    if not line.endswith(b'\n'):
+                        break
+                    if line.strip():
+                        try:
+                            yield json.loads(line)['id'], offset, len(line)
+                        except (ValueError, KeyError, TypeError):
+                            pass
+                    offset += len(line)
+        except FileNotFoundError:
+            pass
+
+    def get_record(self, user_id: str) -> Optional[bytes]:
+        """
+        Read the JSON record of a single user
+        :param user_id: id of the user
+        :return: record (without newline) or None if no user with that id exists
+        """
+        for _ in range(3):
+            locations = self.locations(user_id)
+            if not locations:
+                return None
+            try:
+                with open(self.path, mode='rb') as user_file, \
+                        mmap.mmap(user_file.fileno(), 0, access=mmap.ACCESS_READ) as user_map:
+                    for offset, length in locations:
+                        record = user_map[offset:offset + length].rstrip(b'\n')
+                        try:
+                            if json.loads(record)['id'] == user_id:
+                                return record
+                        except (ValueError, KeyError, TypeError):
+                            pass
+            except (FileNotFoundError, ValueError):
+                # no file or an empty one (can't be mapped)
+                return None
+            # the file has been compacted and the index isn't re-built yet: try again
+        # index still doesn't match the file: search the complete file
+        location = self._scan(user_id, 0)
+        if location is None:
+            return None
+        with open(self.path, mode='rb') as user_file:
+            user_file.seek(location[0])
+            return user_file.read(location[1]).rstrip(b'\n')
+
+
+def field_value(obj: Any, name: str) -> Any:
+    """
+    Get a field value from a model or from a dictionary (parsed JSON)
+    :param obj: model or dictionary
+    :param name: field name
+    :return: value
+    """
+    if isinstance(obj, dict):
+        return obj[name]
+    return getattr(obj, name)
+
+
+class UserQuery:
+    """
+    Secondary indexes over user records for fast queries.
+
+    * hash indexes on scalar fields: value -> set of user ids
+    * inverted indexes from company and role in the job history to user ids
+
+    Indexes are updated for each record added; a record added again with the same id replaces the previous record.
+    """
+
+    SCALAR_FIELDS = ('country', 'city', 'zipCode', 'currentRole', 'currentCompany', 'gender')
+    JOB_FIELDS = ('company', 'role')
+
+    def __init__(self):
+        self.indexes: Dict[str, Dict[str, Set[str]]] = {name: defaultdict(set) for name in self.criteria()}
+        # for each user id the index keys the user is registered with, required to replace records
+        self._keys: Dict[str, Tuple[Tuple[str, str], ...]] = {}
+
+    @classmethod
+    def criteria(cls) -> List[str]:
+        """
+        Names of the supported query criteria
+        :return: list of names
+        """
+        return list(cls.SCALAR_FIELDS) + [f'job_{name}' for name in cls.JOB_FIELDS]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, user_id: str, values: Any) -> None:
+        """
+        Add a user record to the indexes
+        :param user_id: user id
+        :param values: User object or dictionary with the values of a user record (parsed JSON)
+        :return: None
+        """
+        if user_id in self._keys:
+            self.remove(user_id)
+        keys = [(name, field_value(values, name)) for name in self.SCALAR_FIELDS]
+        for job in field_value(values, 'jobHistory'):
+            keys.extend((f'job_{name}', field_value(job, name)) for name in self.JOB_FIELDS)
+        keys = tuple(set(keys))
+        for name, value in keys:
+            self.indexes[name][value].add(user_id)
+        self._keys[user_id] = keys
+
+    def clear(self) -> None:
+        """
+        Remove all users from the indexes
+        :return: None
+        """
+        for index in self.indexes.values():
+            index.clear()
+        self._keys.clear()
+
+    def remove(self, user_id: str) -> None:
+        """
+        Remove a user from the indexes
+        :param user_id: user id
+        :return: None
+        """
+        for name, value in self._keys.pop(user_id, ()):
+            index = self.indexes[name]
+            ids = index[value]
+            ids.discard(user_id)
+            if not ids:
+                del index[value]
+
+    def find(self, **criteria: str) -> Set[str]:
+        """
+        Find users matching all given criteria. Example: find(country='Germany', job_company='cisco')
+        :param criteria: field name/value pairs; job_company and job_role match any entry of the job history
+        :return: set of user ids
+        """
+        if not criteria:
+            return set(self._keys)
+        matches = []
+        for name, value in criteria.items():
+            index = self.indexes.get(name)
+            if index is None:
+                raise ValueError(f'unsupported criterion: {name}')
+            ids = index.get(value)
+            if not ids:
+                return set()
+            matches.append(ids)
+        # start with the smallest set to keep the intersection cheap
+        matches.sort(key=len)
+        return matches[0].intersection(*matches[1:])
+
+    @classmethod
+    def matches(cls, values: Any, criteria: Dict[str, str]) -> bool:
+        """
+        Check a single user record against criteria without indexing it, with the same semantics as find()
+        :param values: User object or dictionary with the values of a user record (parsed JSON)
+        :param criteria: field name/value pairs, all of them have to be supported (see criteria())
+        :return: True if the record matches all criteria
+        """
+        for name, value in criteria.items():
+            if name in cls.SCALAR_FIELDS:
+                if field_value(values, name) != value:
+                    return False
+            elif not any(field_value(job, name[4:]) == value for job in field_value(values, 'jobHistory')):
+                return False
+        return True
+
+
+# bump if changes to the models require records to be validated again
+TRUST_VERSION = 1
+
+
+def trust_marker_path(path: str) -> str:
+    return f'{path}.trust'
 
-class Contact(BaseModel, InputMixin):
-    type: str
-    number: int
-    code: int
 
+def write_trust_marker(path: str) -> Tuple[int, int]:
+    """
+    Mark the current version of a user file as trusted: all records in the file have been validated. Size and
+    modification time of the file are recorded; any later change of the file invalidates the marker.
+    :param path: user file
+    :return: recorded (size, modification time in ns)
+    """
+    stat = os.stat(path)
+    marker = trust_marker_path(path)
+    with open(f'{marker}.tmp', mode='w') as f:
+        json.dump({'version': TRUST_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}, f)
+    os.replace(f'{marker}.tmp', marker)
+    return stat.st_size, stat.st_mtime_ns
 
-def date_validation(v: str) -> str:
+
+def is_trusted(path: str) -> bool:
     """
-    Validate a date string to be dd-mm-yyyy
-    :param v: value to be validated
-    :return: validated string
-    :raises: ValueError for unacceptable dates
+    Check whether a user file has been marked as trusted and hasn't been changed since
+    :param path: user file
+    :return: True if the records in the file don't need to be validated
     """
-    v = v.strip()
     try:
-        datetime.datetime.strptime(v, '%d-%m-%Y')
-    except ValueError:
-        raise ValueError('Dates have to be in DD.MM.YYYY format')
-    return v.strip()
-
-
-class JobHistory(BaseModel, InputMixin):
-    role: str
-    company: str
-    started: str
-    ended: str
-    # stayed: avoid editing. This value is calculated
-    # we are not using a @property b/c properties are not serialized by BaseModel.json()
-    stayed: str = Field(no_edit=True)
-
-    @validator('started', 'ended')
-    def validate_started_ended(cls, v: str, values):
-        """
-        Validator for started and ended fields. Make sure the fields are in dd-mm-yyyy format.
-        :param v: value to validate
-        :param values: values already set
-        :return: validates value
-        :raises: ValueError for unacceptable values
-        """
-        started = values.get('started')
-        v = date_validation(v)
-
-        def sortable(date_str):
-            """
-            get a string in form YYYYMMDD
-            :param date_str: date in DD-MM-YYYY
-            :return: YYYYMMDD
-            """
-            return f'{date_str[-4:]}{date_str[3:5]}{date_str[:2]}'
-
-        if started and sortable(started) > sortable(v):
-            raise ValueError('started needs to be before ended')
-        return v
+        stat = os.stat(path)
+        with open(trust_marker_path(path), mode='r') as f:
+            marker = json.load(f)
+        return marker == {'version': TRUST_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    except (OSError, ValueError):
+        return False
 
-    @staticmethod
-    def stayed_from_started_ended(started, ended):
+
+@lru_cache(maxsize=None)
+def nested_models(model: Type['models.BaseModel']) -> Tuple[Tuple[str, Type['models.BaseModel']], ...]:
+    """
+    Fields of a model which are lists of other models
+    :param model: model class
+    :return: tuple of (field name, model class of list items)
+    """
+    return tuple((name, field.type_) for name, field in model.__fields__.items()
+                 if field.shape == models.SHAPE_LIST and issubclass(field.type_, models.BaseModel))
+
+
+def construct_model(model: Type['models.BaseModel'], values: Dict) -> 'models.BaseModel':
+    """
+    Create a model instance from trusted values (parsed JSON) without validation
+    :param model: model class
+    :param values: field values
+    :return: model instance
+    """
+    for name, item_model in nested_models(model):
+        values[name] = [construct_model(item_model, item) for item in values[name]]
+    return model.construct(**values)
+
+
+class DuplicateEmailError(ValueError):
+    """
+    Raised when adding a user with an email address already recorded for another user
+    """
+
+    def __init__(self, email: str, user_id: str):
+        super().__init__(f'email address {email} is already used by user {user_id}')
+        self.email = email
+        self.user_id = user_id
+
+
+# compact small files only once this many records have been superseded
+COMPACT_MIN_SUPERSEDED = 1000
+
+
+class UserStore:
+    """
+    Append-only store for user records. Each user is saved as one line of JSON; adding a user appends a single line
+    instead of re-writing the whole file.
+
+    * every append is handed to the OS immediately, so a crash of the program never loses records already added
+    * fsync is called every fsync_batch appends (and on close) to also survive power loss
+    * a line torn by a crash in the middle of a write is cut off before the next write
+    * once compact_superseded records have been replaced by later records of the same users (or superseded records
+      outnumber current ones) the file is compacted: only the latest record per user id is kept. The compacted file
+      is written to a temporary file which then atomically replaces the original. Files without superseded records
+      are never compacted
+    * an index (see UserIndex) allows to read individual users by id without scanning the file
+    * optional secondary indexes (see UserQuery) are populated when opening the store and updated for each append
+    * email addresses are unique: adding a user with an email address (normalized like EmailStr) of another user is
+      rejected. The index maps each address to a user id; only if the address is found there the record of that user
+      is read to check whether the user still has that address
+    * while the file is trusted (see is_trusted()) the trust marker is updated on each sync, so the records don't need
+      to be validated when reading them again. The store remembers the state (size, modification time) of the file
+      after its own last write; if the file has been changed by anyone else and that change hasn't been marked as
+      trusted, the store stops marking the file as trusted
+
+    Several processes can use the same store at the same time. All writes (appends, compaction, index updates) happen
+    while holding an exclusive advisory lock on a lock file next to the user file. Before each write the store picks
+    up records added and compactions done by other processes. Readers (UserLookup, query_users(), iter_users()) don't
+    take the lock and never wait for writers: the user file only ever grows by complete records or is atomically
+    replaced.
+    """
+
+    def __init__(self, path: str = USER_FILE, fsync_batch: int = 100, compact_superseded: Optional[int] = 10000,
+                 query: Optional[UserQuery] = None):
+        """
+        :param path: file to store the user records in
+        :param fsync_batch: number of appends after which the file is synced to disk
+        :param compact_superseded: number of superseded records after which the file is compacted. None: never compact
+            automatically
+        :param query: secondary indexes to maintain
+        """
+        self.path = path
+        self.fsync_batch = max(1, fsync_batch)
+        self.compact_superseded = compact_superseded
+        self._unsynced = 0
+        self._file = None
+        self._size = 0
+        self._map = None
+        self.query = None
+        self._lock_file = open(f'{path}.lock', mode='a')
+        self._lock_depth = 0
+        # decided when the file is opened (see _verify_trust())
+        self._trusted = True
+        # (size, modification time) of the file as last written, marked or verified as trusted by this store
+        self._stamp: Optional[Tuple[int, int]] = None
+        self.index = UserIndex(self.path)
+        self.query = query
+        # size of the user file covered by the query, see _update_query()
+        self._query_size = 0
+        with self.lock():
+            # acquiring the lock opens the file and fills the query
+            pass
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """
+        Context manager holding the exclusive lock on the store. When acquiring the lock the store catches up with
+        changes by other processes. The lock is re-entrant.
         """
-        2/ JobsHistory attribute should be also a list of the user past jobs. One job entry should follow this format :
-        {"role": "cisconian", "company": "cisco", "started": "24-01-2000", "ended": "24-01-3000", "stayed": "1000 yrs 0
-        months 0 days"}
+        if not self._lock_depth and fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            if self._lock_depth == 1:
+                self._catch_up()
+            yield
+        finally:
+            self._lock_depth -= 1
+            if not self._lock_depth and fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
 
-        3/ The stayed attribut inside each job entry, should be deducted from the started & ended values.
-        :param started:
-        :param ended:
-        :return:
+    def _open(self) -> None:
         """
+        Open the user file for appending. Requires the lock.
+        :return: None
+        """
+        if self._file is not None:
+            self._file.close()
+            # records appended by us have been synced by whoever replaced the file
+            self._unsynced = 0
+        self._close_map()
+        self._file = open(self.path, mode='a+b', buffering=0)
+        self._size = self._file.seek(0, os.SEEK_END)
+        self._verify_trust()
+        self._repair_tail()
+        self.index.catch_up(self._size)
+        if self.query is not None:
+            # the file might have been replaced by a compaction: records covered so far may have been superseded
+            self.query.clear()
+            self._query_size = 0
+            self._update_query()
 
+    def _catch_up(self) -> None:
+        """
+        Pick up changes by other processes: records appended and the file being replaced by a compaction. Requires the
+        lock.
+        :return: None
+        """
         try:
-            started = datetime.datetime.strptime(started, DATE_FORMAT)
-            ended = datetime.datetime.strptime(ended, DATE_FORMAT)
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._file is None or os.fstat(self._file.fileno()).st_ino != inode:
+            self._open()
+            return
+        self._verify_trust()
+        size = self._file.seek(0, os.SEEK_END)
+        if size == self._size:
+            return
+        self._size = size
+        self._repair_tail()
+        self.index.catch_up(self._size)
+        self._update_query()
+
+    def _update_query(self) -> None:
+        """
+        Add the records appended since the query was last updated to the query. Requires the lock.
+        :return: None
+        """
+        if self.query is None or self._query_size >= self._size:
+            return
+        with open(self.path, mode='rb') as f:
+            f.seek(self._query_size)
+            offset = self._query_size
+            for line in f:
+                offset += len(line)
+                if offset > self._size:
+                    break
+                try:
+                    values = json.loads(line)
+                    self.query.add(values['id'], values)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # blank line or not a valid record
+                    pass
+        self._query_size = self._size
+
+    def _state(self) -> Tuple[int, int]:
+        stat = os.fstat(self._file.fileno())
+        return stat.st_size, stat.st_mtime_ns
+
+    def _verify_trust(self) -> None:
+        """
+        Check whether the file is still trusted: it either hasn't changed since this store last wrote, marked or
+        verified it, or the change has been marked as trusted by another store. Requires the lock.
+        :return: None
+        """
+        if not self._trusted:
+            return
+        state = self._state()
+        if state == self._stamp:
+            return
+        # a new or empty file can be trusted right away
+        if is_trusted(self.path) or not state[0]:
+            self._stamp = state
+        else:
+            self._trusted = False
+
+    def _mark_trusted(self) -> None:
+        """
+        Update the trust marker after a change by this store. Requires the lock.
+        :return: None
+        """
+        if self._trusted:
+            self._stamp = write_trust_marker(self.path)
+
+    def _repair_tail(self) -> None:
+        """
+        Make sure that the file ends with a complete line. Requires the lock.
+        A partial line left behind by a crash during a write is removed. Files written by earlier versions don't have a
+        newline after the last record; in that case the newline is added.
+        :return: None
+        """
+        fd = self._file.fileno()
+        if not self._size or os.pread(fd, 1, self._size - 1) == b'\n':
+            return
+        # search backwards for the start of the last line
+        start = self._size
+        tail = b''
+        while start and b'\n' not in tail:
+            read_from = max(0, start - 4096)
+            tail = os.pread(fd, start - read_from, read_from) + tail
+            start = read_from
+        line_start = start + tail.rfind(b'\n') + 1
+        try:
+            json.loads(tail[line_start - start:])
         except ValueError:
+            # torn write: drop the partial record
+            os.ftruncate(fd, line_start)
+            self._size = line_start
+        else:
+            write_all(self._file, b'\n')
+            self._size += 1
+        os.fsync(fd)
+        self._mark_trusted()
+
+    def append(self, user: 'models.User') -> None:
+        """
+        Append a single user record to the file
+        :param user: user to add
+        :return: None
+        :raises: DuplicateEmailError if the email address is used by another user
+        """
+        self._append([(user.id, user.email, user.json(), user)])
+
+    def append_record(self, user_id: str, email: str, record: str) -> None:
+        """
+        Append a single user record which already has been validated and serialized to JSON
+        :param user_id: id of the user
+        :param email: email address of the user
+        :param record: JSON representation of the user
+        :return: None
+        :raises: DuplicateEmailError if the email address is used by another user
+        """
+        self._append([(user_id, email, record, None)])
+
+    def append_records(self, records: List[Tuple[str, str, str, int]],
+                       reject_duplicates: bool = False) -> List[Tuple[str, str, str, int]]:
+        """
+        Append user records which already have been validated and serialized to JSON
+        :param records: list of (user id, email address, JSON representation of the user, offset of the record in the
+            input it was read from); the offset is only passed through to the skipped records
+        :param reject_duplicates: False: raise DuplicateEmailError if an email address is used by another user and
+            append none of the records; True: skip records with email addresses used by other users
+        :return: list of skipped records as passed in
+        :raises: DuplicateEmailError if an email address is used by another user and duplicates aren't rejected
+        """
+        skipped = self._append([(user_id, email, record, None) for user_id, email, record, _ in records],
+                               reject_duplicates=reject_duplicates)
+        return [records[i] for i in skipped]
+
+    def _email_owner(self, email: str) -> Optional[str]:
+        """
+        Get the user currently using an email address. Requires the lock.
+        :param email: normalized email address
+        :return: user id or None if no user uses the address
+        """
+        user_id = self.index.email_owner(email)
+        if user_id is None:
             return None
-        diff_year = ended.year - started.year
-        diff_month = ended.month - started.month
-        diff_day = ended.day - started.day
-        if diff_day < 0:
-            # add days of previous month
-            last_day_of_previous_month = ended - datetime.timedelta(days=ended.day)
-            diff_day += last_day_of_previous_month.day
-            diff_month -= 1
-        if diff_month < 0:
-            diff_month += 12
-            diff_year -= 1
-        return f'{diff_year} yrs {diff_month} months {diff_day} days'
-
-    def __init__(self, **data: Any):
-        super().__init__(**data)
-        self.stayed = self.stayed_from_started_ended(self.started, self.ended)
-
-
-user_log = logging.getLogger(f'{__name__}.User')
-fh = logging.FileHandler('users.log')
-fh.setFormatter(logging.Formatter(fmt='%(asctime)s - %(message)s'))
-user_log.addHandler(fh)
-user_log.setLevel(logging.INFO)
-
-
-class User(BaseModel, InputMixin):
-    id: str = Field(default_factory=lambda: f'{uuid.uuid4()}')
-    firstname: str
-    email: EmailStr
-    country: str
-    city: str
-    zipCode: str
-    currentRole: str
-    currentCompany: str
-    gender: str
-    birthday: str
-    contacts: List[Contact]
-    jobHistory: List[JobHistory]
-
-    @validator('birthday')
-    def validate_birthday(cls, v: str):
-        """
-        Validatoor for birthday field
-        Brithday attribute should be into this string format: "Friday 01 January 2020"
-        we also allow dd-mm-yyyy
-        :param v: value to validate
-        :return: validated and in desired format
-        :raises: ValueError for unacceptable values
-        """
-
-        date_format = '%A %d %B %Y'
-        v = v.strip()
+        # the user might have changed the address since: the latest record of the user decides
+        try:
+            current = normalize_email(json.loads(self._read(*self.index.get(user_id)))['email'])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return user_id if current == email else None
+
+    @instrumented()
+    def _append(self, records: List[Tuple[str, str, str, Optional['models.User']]],
+                reject_duplicates: bool = False) -> List[int]:
+        if not records:
+            return []
+        with self.lock():
+            accepted = []
+            rejected = []
+            # email addresses of the records in this batch; the index only knows the records already written
+            batch_emails = {}
+            batch_owners = {}
+            for position, (user_id, email, record, user) in enumerate(records):
+                email = normalize_email(email)
+                owner = batch_owners.get(email)
+                if owner is None:
+                    owner = self._email_owner(email)
+                    if owner is not None and owner in batch_emails and batch_emails[owner] != email:
+                        # the user changes the address in this batch
+                        owner = None
+                if owner is not None and owner != user_id:
+                    if not reject_duplicates:
+                        raise DuplicateEmailError(email, owner)
+                    rejected.append(position)
+                    continue
+                batch_owners.pop(batch_emails.get(user_id), None)
+                batch_emails[user_id] = email
+                batch_owners[email] = user_id
+                accepted.append((user_id, email, record, user))
+            if not accepted:
+                return rejected
+            records = accepted
+            data = []
+            entries = []
+            offset = self._size
+            for user_id, email, record, _ in records:
+                line = f'{record}\n'.encode()
+                data.append(line)
+                entries.append((user_id, offset, len(line), email))
+                offset += len(line)
+            # one write() on a file opened for appending: the records are never interleaved with other writes
+            write_all(self._file, b''.join(data))
+            self._size = offset
+            if self._trusted:
+                # all records appended by the store have been validated: the file as written now can be trusted
+                self._stamp = self._state()
+            self.index.add(entries)
+            if self.query is not None:
+                for user_id, _, record, user in records:
+                    self.query.add(user_id, user if user is not None else json.loads(record))
+                self._query_size = self._size
+            self._unsynced += len(records)
+            if self._unsynced >= self.fsync_batch:
+                self.sync()
+            if self._needs_compaction():
+                self.compact()
+        return rejected
+
+    @instrumented()
+    def sync(self) -> None:
+        """
+        Make sure that all records appended so far are on disk
+        :return: None
+        """
+        if not self._unsynced:
+            return
+        with self.lock():
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._mark_trusted()
+
+    def _read(self, offset: int, length: int, remap: bool = False) -> bytes:
+        """
+        Read a record from the file using a memory map of the file
+        :param offset: offset of the record
+        :param length: length of the record
+        :param remap: True: map the file again, for example after the file has been replaced
+        :return: record
+        """
+        if remap or self._map is None or offset + length > len(self._map):
+            # (re-)map the file to cover the records appended since the file was last mapped
+            self._close_map()
+            with open(self.path, mode='rb') as user_file:
+                self._map = mmap.mmap(user_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    @instrumented()
+    def get_user(self, user_id: str) -> Optional['models.User']:
+        """
+        Read a single user from the file using the index. Doesn't wait for other processes writing to the store.
+        :param user_id: id of the user
+        :return: user or None if no user with that id exists
+        """
+        record = self.get_record(user_id)
+        return None if record is None else models.User.parse_raw(record)
+
+    def get_record(self, user_id: str) -> Optional[bytes]:
+        """
+        Read the JSON record of a single user from the file using the index, without creating a User object. Doesn't
+        wait for other processes writing to the store.
+        :param user_id: id of the user
+        :return: record (without newline) or None if no user with that id exists
+        """
+        location = self.index.get(user_id)
+        if location is None:
+            # the user might have been added by another process since the index was last read
+            self.index.refresh()
+            location = self.index.get(user_id)
+            if location is None:
+                return None
+        for attempt in range(3):
+            if attempt == 2:
+                # index still doesn't match the file
+                with self.lock():
+                    self.index.rebuild()
+            elif attempt:
+                # the file has been compacted by another process: the index might be outdated
+                self.index.refresh()
+            if attempt:
+                location = self.index.get(user_id)
+                if location is None:
+                    return None
+            record = self._read(*location, remap=bool(attempt)).rstrip(b'\n')
+            try:
+                if json.loads(record)['id'] == user_id:
+                    return record
+            except (ValueError, KeyError, TypeError):
+                continue
+        return None
+
+    def _close_map(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _needs_compaction(self) -> bool:
+        """
+        Check whether enough records have been superseded to make a compaction worthwhile. A compaction costs time
+        proportional to the size of the file, so it's also done once superseded records outnumber current ones.
+        :return: True if the file should be compacted
+        """
+        if not self.compact_superseded:
+            return False
+        superseded = self.index.superseded
+        return superseded >= self.compact_superseded or superseded >= max(len(self.index), COMPACT_MIN_SUPERSEDED)
+
+    @instrumented()
+    def compact(self) -> None:
+        """
+        Re-write the file keeping only the latest record for each user id. The new file is written to a temporary
+        file first which then replaces the original file, so the original stays intact if the compaction fails.
+        Processes reading the file while it is compacted continue to read the original file.
+        :return: None
+        """
+        with self.lock():
+            self.sync()
+            # 1st pass: determine the last line for each user id
+            latest = {}
+            with open(self.path, mode='rb') as f:
+                for line_number, line in enumerate(f):
+                    try:
+                        latest[json.loads(line)['id']] = line_number
+                    except (ValueError, KeyError, TypeError):
+                        # drop lines which are not valid records
+                        pass
+            keep = set(latest.values())
+            del latest
+
+            # 2nd pass: copy the lines to keep to a temporary file
+            temp_path = f'{self.path}.compact'
+            with open(self.path, mode='rb') as f, open(temp_path, mode='wb') as temp:
+                temp.writelines(line for line_number, line in enumerate(f) if line_number in keep)
+                temp.flush()
+                os.fsync(temp.fileno())
+            os.replace(temp_path, self.path)
+            self._sync_directory()
+            self._mark_trusted()
+            self.index.rebuild()
+            self._open()
+
+    def _sync_directory(self) -> None:
+        """
+        fsync the directory of the store to make sure that a rename is persisted
+        :return: None
+        """
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:
+            # not supported on all platforms
+            return
         try:
-            date = datetime.datetime.strptime(v, date_format)
-            return v
-        except Exception:
+            os.fsync(fd)
+        except OSError:
             pass
-        # we also allow dd-mm-yyyy
-        date_validation(v)
-        return datetime.date(year=int(v[-4:]), month=int(v[3:5]), day=int(v[:2])).strftime(date_format)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        """
+        Sync and close the file
+        :return: None
+        """
+        if self._file is None:
+            return
+        self.sync()
+        self._file.close()
+        self._file = None
+        self._close_map()
+        self.index.close()
+        self._lock_file.close()
+
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def query_users(path: str, criteria: Dict[str, str]) -> List[bytes]:
+    """
+    Find the users matching all given criteria (see UserQuery.find()) without taking the store lock. The file is read
+    once; records appended by other processes in the meantime are not considered. Records are checked while reading,
+    only the locations of matching records are kept.
+    :param path: user file
+    :param criteria: field name/value pairs
+    :return: list of JSON records (without newline)
+    :raises: ValueError if a criterion isn't supported
+    """
+    unsupported = set(criteria).difference(UserQuery.criteria())
+    if unsupported:
+        raise ValueError(f'unsupported criterion: {", ".join(sorted(unsupported))}')
+    # latest matching record of each user; a user is dropped again if a later record doesn't match
+    locations = {}
+    try:
+        user_file = open(path, mode='rb')
+    except FileNotFoundError:
+        return []
+    with user_file:
+        offset = 0
+        for line in user_file:
+            # skip a record which might still be written and lines which are not valid records
+            if line.endswith(b'\n') and line.strip():
+                try:
+                    values = json.loads(line)
+                    user_id = values['id']
+                    matches = UserQuery.matches(values, criteria)
+                except (ValueError, KeyError, TypeError):
+                    pass
+                else:
+                    locations.pop(user_id, None)
+                    if matches:
+                        locations[user_id] = (offset, len(line))
+            offset += len(line)
+        if not locations:
+            return []
+        # the file might be replaced by a compaction in the meantime: read the records from the file just scanned
+        with mmap.mmap(user_file.fileno(), 0, access=mmap.ACCESS_READ) as user_map:
+            return [user_map[offset:offset + length].rstrip(b'\n') for offset, length in locations.values()]
+
+
+def record_id(line: bytes) -> str:
+    """
+    Get the user id of a JSON record. Records written from User objects start with the id; only other records have
+    to be parsed.
+    :param line: JSON record
+    :return: user id
+    :raises: ValueError, KeyError or TypeError if the line isn't a valid record
+    """
+    if line.startswith(b'{"id": "'):
+        end = line.find(b'"', 8)
+        if end > 0 and b'\\' not in line[8:end]:
+            return line[8:end].decode()
+    return json.loads(line)['id']
+
+
+def iter_user_lines(path: str = USER_FILE, latest: bool = False) -> Iterator[bytes]:
+    """
+    Iterate over the records in a user file without reading the whole file into memory
+    :param path: user file
+    :param latest: True: skip records superseded by a later record of the same user (see UserLookup.latest())
+    :return: generator of raw JSON records; empty lines are skipped
+    """
+    lookup = UserLookup(path)
+    # checking each record costs time: only done if there are superseded records
+    if latest and count_records(path) == len(lookup):
+        latest = False
+    with open(path, mode='rb') as user_file, lookup.latest() as is_latest:
+        offset = 0
+        for line in user_file:
+            line_offset = offset
+            offset += len(line)
+            if not line.endswith(b'\n'):
+                # last record: might still be written by another process
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+            if not line.strip():
+                continue
+            if latest:
+                try:
+                    if not is_latest(record_id(line), line_offset):
+                        continue
+                except (ValueError, KeyError, TypeError):
+                    pass
+            yield line
+
+
+def iter_users(path: str = USER_FILE, trust: bool = True) -> Iterator['models.User']:
+    """
+    Lazily read users from a file: only one User object is created at a time. Only the latest record of each user is
+    read.
+    Records are only validated if the file isn't trusted (see is_trusted()). After successfully validating all records
+    the file is marked as trusted.
+    :param path: user file
+    :param trust: False: always validate the records
+    :return: generator of User objects
+    """
+    if trust and is_trusted(path):
+        for line in iter_user_lines(path, latest=True):
+            yield construct_model(models.User, json.loads(line))
+        return
+    stat = os.stat(path)
+    for line in iter_user_lines(path, latest=True):
+        yield models.User.parse_raw(line)
+    new_stat = os.stat(path)
+    if (new_stat.st_size, new_stat.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+        # all records are valid and the file didn't change in the meantime
+        write_trust_marker(path)
+
+
+@lru_cache(maxsize=None)
+def compact_type(model: Type['models.BaseModel']) -> type:
+    """
+    Compact representation of a model: a named tuple with the same fields. Named tuples don't have a __dict__ and no
+    __fields_set__ which makes them a lot smaller than pydantic models.
+    :param model: model class
+    :return: named tuple class
+    """
+    return namedtuple(f'Compact{model.__name__}', list(model.__fields__))
+
+
+@lru_cache(maxsize=None)
+def compact_schema(model: Type['models.BaseModel']) -> Tuple[Tuple[str, bool, Optional[Type['models.BaseModel']]], ...]:
+    """
+    How to convert the fields of a model to the compact representation
+    :param model: model class
+    :return: tuple of (field name, intern value?, model class of list items)
+    """
+    item_models = dict(nested_models(model))
+    return tuple((name, bool(field.field_info.extra.get('intern')), item_models.get(name))
+                 for name, field in model.__fields__.items())
+
+
+def to_compact(model: Type['models.BaseModel'], values: Any) -> tuple:
+    """
+    Convert a model instance or parsed JSON to the compact representation. Lists are converted to tuples and values of
+    fields marked with intern=True are interned, so that each distinct value only exists once in memory.
+    :param model: model class
+    :param values: model instance or dictionary
+    :return: named tuple (see compact_type())
+    """
+    fields = []
+    for name, intern, item_model in compact_schema(model):
+        v = field_value(values, name)
+        if item_model is not None:
+            v = tuple(to_compact(item_model, item) for item in v)
+        elif intern and v is not None:
+            v = sys.intern(v)
+        fields.append(v)
+    return compact_type(model)._make(fields)
+
+
+def from_compact(model: Type['models.BaseModel'], compact: tuple) -> 'models.BaseModel':
+    """
+    Convert the compact representation back to a model instance
+    :param model: model class
+    :param compact: named tuple created by to_compact()
+    :return: model instance
+    """
+    values = compact._asdict()
+    for name, item_model in nested_models(model):
+        values[name] = [from_compact(item_model, item) for item in values[name]]
+    return model.construct(**values)
+
+
+def iter_compact_users(path: str = USER_FILE) -> Iterator[tuple]:
+    """
+    Lazily read users from a file in the compact representation. Like iter_users() records are only validated if the
+    file isn't trusted.
+    :param path: user file
+    :return: generator of CompactUser named tuples
+    """
+    if is_trusted(path):
+        for line in iter_user_lines(path, latest=True):
+            yield to_compact(models.User, json.loads(line))
+    else:
+        for user in iter_users(path):
+            yield to_compact(models.User, user)
+
+
+def edit_compact_user(compact: tuple) -> Optional[tuple]:
+    """
+    Edit a user in the compact representation on the console. Only for editing the user is converted to a User object.
+    :param compact: CompactUser named tuple
+    :return: edited user as CompactUser or None if the input failed
+    """
+    user = models.User.from_console(current_value=from_compact(models.User, compact))
+    return user and to_compact(models.User, user)
+
+
+@instrumented()
+def count_users(path: str = USER_FILE) -> int:
+    """
+    Count the users in a user file using the index (see UserLookup): users with several records are counted once,
+    and the file isn't read
+    :param path: user file
+    :return: number of users
+    :raises: FileNotFoundError if the file doesn't exist
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    return len(UserLookup(path))
 
-    def log_created(self)->None:
+
+def count_records(path: str = USER_FILE) -> int:
+    """
+    Count the records in a user file without parsing them
+    :param path: user file
+    :return: number of records
+    """
+    count = 0
+    last = b'\n'
+    with open(path, mode='rb') as user_file:
+        while block := user_file.read(READ_BLOCK_SIZE):
+            count += block.count(b'\n')
+            last = block[-1:]
+    # last record might not be terminated by a newline
+    return count + (last != b'\n')
+
+
+IMPORT_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def byte_ranges(path: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[Tuple[int, int]]:
+    """
+    Split a file into ranges of roughly chunk_size bytes. Ranges always end at a line boundary.
+    :param path: file to split
+    :param chunk_size: target size of each range
+    :return: generator of (start, end) tuples
+    """
+    with open(path, mode='rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            # move on to the end of the current line
+            f.readline()
+            end = f.tell()
+            yield start, end
+            start = end
+
+
+def validate_range(path: str, start: int, end: int) -> Tuple[List[Tuple[str, str, str, int]], List[str]]:
+    """
+    Validate the user records in a range of a file. Executed in a worker process during a bulk import.
+    :param path: file with user records
+    :param start: start of the range
+    :param end: end of the range
+    :return: tuple of valid records as (id, email, JSON, offset) tuples and rejected records as JSON lines with the
+        validation errors
+    """
+    valid = []
+    rejected = []
+    with open(path, mode='rb') as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if offset >= end:
+                break
+            line_offset = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                user = models.User.parse_raw(line)
+            except models.ValidationError as e:
+                rejected.append(json.dumps({'offset': line_offset,
+                                            'record': line.decode(errors='replace').rstrip('\n'),
+                                            'errors': json.loads(e.json())}))
+            else:
+                valid.append((user.id, user.email, user.json(), line_offset))
+    return valid, rejected
+
+
+@instrumented()
+def bulk_import(path: str, store: UserStore, rejects_path: str, workers: Optional[int] = None,
+                chunk_size: int = IMPORT_CHUNK_SIZE) -> Tuple[int, int]:
+    """
+    Import user records from a JSON lines file. Chunks of the file are validated in parallel in a pool of processes;
+    valid records are appended to the store in the order of the input file and invalid records are written to a
+    rejects file together with the validation errors. Records with an email address used by another user are rejected
+    as well.
+    :param path: file to import
+    :param store: store to add the valid records to
+    :param rejects_path: file to write rejected records to
+    :param workers: number of worker processes; default: number of CPUs
+    :param chunk_size: size of the chunks to be validated by a worker
+    :return: tuple with the number of imported and the number of rejected records
+    """
+    # only needed for imports; importing it takes longer than most other commands
+    from concurrent.futures import ProcessPoolExecutor
+
+    imported = 0
+    rejected = 0
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor, open(rejects_path, mode='w') as rejects_file:
+        # only keep a limited number of chunks in flight to bound the memory used for results not yet written
+        in_flight = []
+        max_in_flight = 2 * workers
+        ranges = byte_ranges(path, chunk_size)
+        while True:
+            for start, end in ranges:
+                in_flight.append(executor.submit(validate_range, path, start, end))
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            valid, rejects = in_flight.pop(0).result()
+            duplicates = store.append_records(valid, reject_duplicates=True)
+            rejects.extend(json.dumps({'offset': offset,
+                                       'record': record,
+                                       'errors': [{'loc': ['email'], 'msg': f'email address {email} is already used',
+                                                   'type': 'value_error.duplicate_email'}]})
+                           for _, email, record, offset in duplicates)
+            rejects_file.writelines(f'{r}\n' for r in rejects)
+            imported += len(valid) - len(duplicates)
+            rejected += len(rejects)
+    store.sync()
+    return imported, rejected
+
+
+BINARY_MAGIC = b'UREC\x01'
+# frame types in binary user files
+FRAME_STRING = b'S'
+FRAME_USER = b'U'
+
+
+def write_varint(buffer: bytearray, value: int) -> None:
+    """
+    Append an unsigned integer to a buffer using a variable number of bytes (7 bits per byte)
+    :param buffer: buffer to append to
+    :param value: value
+    :return: None
+    """
+    while value > 0x7f:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """
+    Read an unsigned integer written by write_varint()
+    :param data: data to read from
+    :param pos: position of the integer
+    :return: tuple of the value and the position after the integer
+    """
+    b = data[pos]
+    if b < 0x80:
+        return b, pos + 1
+    value = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+
+# field kinds in the binary format
+KIND_STR, KIND_INTERNED, KIND_INT, KIND_LIST = range(4)
+
+
+@lru_cache(maxsize=None)
+def binary_schema(model: Type['models.BaseModel']) -> Tuple[Tuple[str, int, Optional[Type['models.BaseModel']]], ...]:
+    """
+    Determine how the fields of a model are stored in binary files
+    :param model: model class
+    :return: tuple of (field name, kind, model class of list items)
+    """
+    schema = []
+    for name, field in model.__fields__.items():
+        field: 'models.ModelField'
+        if field.shape == models.SHAPE_LIST and issubclass(field.type_, models.BaseModel):
+            schema.append((name, KIND_LIST, field.type_))
+        elif issubclass(field.type_, int):
+            schema.append((name, KIND_INT, None))
+        elif field.field_info.extra.get('intern'):
+            schema.append((name, KIND_INTERNED, None))
+        elif issubclass(field.type_, str):
+            schema.append((name, KIND_STR, None))
+        else:
+            raise NotImplementedError(f'{model.__name__}.{name}: type not supported in binary files')
+    return tuple(schema)
+
+
+class BinaryUserFile:
+    """
+    Compact binary file for user records.
+
+    The file starts with BINARY_MAGIC followed by frames. Each frame has a type byte, the length of the payload and
+    the payload:
+    * FRAME_STRING defines the next entry of the string table. Values of fields marked with intern=True are stored as
+      references into that table
+    * FRAME_USER is a user record. Fields are stored in the order of the model fields without field names: strings as
+      length and UTF-8, integers zigzag encoded, lists as number of items followed by the items.
+    Integers (lengths, references, ..) are stored with a variable number of bytes. Strings and references are
+      stored +1 so that 0 can represent None.
+
+    As the file is only written from valid User objects records are not validated again when reading them.
+    """
+
+    def __init__(self, path: str, mode: str = 'r'):
+        """
+        :param path: binary user file
+        :param mode: 'r': read only, the file must exist; 'a': append to the file, create it if it doesn't exist;
+            'w': create an empty file, replacing an existing one
+        :raises: ValueError if the file isn't a binary user file
+        """
+        if mode not in ('r', 'a', 'w'):
+            raise ValueError(f'invalid mode: {mode}')
+        self.path = path
+        self.strings = []
+        self.string_refs = {}
+        self._file = None
+        if mode == 'r':
+            with open(self.path, mode='rb') as f:
+                self._check_magic(f.read(len(BINARY_MAGIC)))
+            return
+        # appending reads the string table: the file has to be readable
+        self._file = open(self.path, mode='a+b' if mode == 'a' else 'wb')
+        if not self._file.tell():
+            self._file.write(BINARY_MAGIC)
+            return
+        try:
+            self._load_strings()
+        except ValueError:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _load_strings(self) -> None:
+        """
+        Read the string table from the file opened for appending. An incomplete frame at the end of the file (torn
+        write) is removed
+        :return: None
+        """
+        size = self._file.tell()
+        with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            end = self._check_magic(data)
+            for frame_type, start, end in self._frames(data, end):
+                if frame_type == FRAME_STRING:
+                    self._define(str(data[start:end], 'utf-8'))
+        if end < size:
+            self._file.truncate(end)
+
+    def _check_magic(self, data: Union[bytes, mmap.mmap]) -> int:
+        if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+            raise ValueError(f'{self.path} is not a binary user file')
+        return len(BINARY_MAGIC)
+
+    @staticmethod
+    def _frames(data: Union[bytes, mmap.mmap], pos: int) -> Iterator[Tuple[bytes, int, int]]:
+        """
+        Iterate over the frames in the data
+        :param data: file content or memory map of the file
+        :param pos: position of the 1st frame
+        :return: generator of (frame type, position of the payload, position after the frame). Stops at an incomplete
+            frame
+        """
+        size = len(data)
+        while pos < size:
+            frame_type = data[pos:pos + 1]
+            try:
+                length, start = read_varint(data, pos + 1)
+            except IndexError:
+                return
+            pos = start + length
+            if pos > size:
+                return
+            yield frame_type, start, pos
+
+    def _define(self, value: str) -> int:
+        self.string_refs[value] = len(self.strings)
+        self.strings.append(value)
+        return len(self.strings) - 1
+
+    def _write_frame(self, frame_type: bytes, payload: bytearray) -> None:
+        frame = bytearray(frame_type)
+        write_varint(frame, len(payload))
+        frame += payload
+        self._file.write(frame)
+
+    def _encode(self, buffer: bytearray, model: Type['models.BaseModel'], values: Dict) -> None:
         """
-        Write a log entry for each user created. Only for users created via console
+        Encode a model
+        :param buffer: buffer to write to
+        :param model: model class
+        :param values: field values
         :return: None
         """
-        user_log.info(f'{self.id}, {self.firstname} created')
+        for name, kind, item_model in binary_schema(model):
+            v = values[name]
+            if kind == KIND_LIST:
+                write_varint(buffer, len(v))
+                for item in v:
+                    self._encode(buffer, item_model, item.__dict__)
+            elif kind == KIND_INT:
+                write_varint(buffer, v << 1 if v >= 0 else (-v << 1) - 1)
+            elif v is None:
+                buffer.append(0)
+            elif kind == KIND_INTERNED:
+                ref = self.string_refs.get(v)
+                if ref is None:
+                    # new string: define before using it
+                    ref = self._define(v)
+                    self._write_frame(FRAME_STRING, bytearray(v.encode()))
+                write_varint(buffer, ref + 1)
+            else:
+                v = v.encode()
+                write_varint(buffer, len(v) + 1)
+                buffer += v
+
+    def _decode(self, data: Union[bytes, mmap.mmap], pos: int,
+                model: Type['models.BaseModel']) -> Tuple['models.BaseModel', int]:
+        """
+        Decode a model
+        :param data: data to decode from
+        :param pos: position to start decoding at
+        :param model: model class
+        :return: tuple of model instance and position after the model
+        """
+        values = {}
+        strings = self.strings
+        for name, kind, item_model in binary_schema(model):
+            if kind == KIND_LIST:
+                count, pos = read_varint(data, pos)
+                items = []
+                for _ in range(count):
+                    item, pos = self._decode(data, pos, item_model)
+                    items.append(item)
+                values[name] = items
+            elif kind == KIND_INT:
+                v, pos = read_varint(data, pos)
+                values[name] = -((v + 1) >> 1) if v & 1 else v >> 1
+            elif kind == KIND_INTERNED:
+                v, pos = read_varint(data, pos)
+                values[name] = strings[v - 1] if v else None
+            else:
+                length, pos = read_varint(data, pos)
+                if length:
+                    values[name] = str(data[pos:pos + length - 1], 'utf-8')
+                    pos += length - 1
+                else:
+                    values[name] = None
+        return model.construct(**values), pos
+
+    def append(self, user: 'models.User') -> None:
+        """
+        Append a user to the file
+        :param user: user
+        :return: None
+        """
+        payload = bytearray()
+        self._encode(payload, models.User, user.__dict__)
+        self._write_frame(FRAME_USER, payload)
+
+    def __iter__(self) -> Iterator['models.User']:
+        """
+        Iterate over all users in the file. The file is read through a memory map: only one user is decoded at a time.
+        :return: generator of User objects
+        """
+        if self._file is not None:
+            self._file.flush()
+        self.strings = []
+        self.string_refs = {}
+        with open(self.path, mode='rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for frame_type, start, end in self._frames(data, self._check_magic(data)):
+                if frame_type == FRAME_STRING:
+                    self._define(str(data[start:end], 'utf-8'))
+                elif frame_type == FRAME_USER:
+                    yield self._decode(data, start, models.User)[0]
+
+    def close(self) -> None:
+        if self._file is not None and not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+def json_to_binary(path: str, binary_path: str) -> int:
+    """
+    Convert a JSON lines user file to a binary user file. The binary file is written to a temporary file first which
+    then replaces the binary file, so an existing binary file stays intact if the conversion fails.
+    :param path: JSON lines file
+    :param binary_path: binary file; an existing file is replaced
+    :return: number of records converted
+    :raises: FileNotFoundError if the JSON lines file doesn't exist, ValidationError if the file isn't trusted and
+        contains an invalid record
+    """
+    # fail before creating any file if there is nothing to convert
+    os.stat(path)
+    count = 0
+    temp_path = f'{binary_path}.tmp'
+    try:
+        with BinaryUserFile(temp_path, mode='w') as binary_file:
+            for count, user in enumerate(iter_users(path), start=1):
+                binary_file.append(user)
+        os.replace(temp_path, binary_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return count
+
+
+def binary_to_json(binary_file: BinaryUserFile, store: UserStore) -> Tuple[int, List[Tuple[str, str]]]:
+    """
+    Convert a binary user file to JSON lines. Users are read from binary files without validation (see
+    BinaryUserFile); the store only takes validated users, so they are validated before appending them. Invalid users
+    and users with an email address used by another user are skipped.
+    :param binary_file: binary file
+    :param store: store to add the users to
+    :return: tuple of number of users imported and list of (user id, reason) for the users skipped
+    """
+    imported = 0
+    rejected = []
+    for user in binary_file:
+        try:
+            user = models.User.parse_obj(user.dict())
+            store.append(user)
+        except models.ValidationError as e:
+            errors = ', '.join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            rejected.append((user.id, f'invalid record ({errors})'))
+        except DuplicateEmailError as e:
+            rejected.append((user.id, str(e)))
+        else:
+            imported += 1
+    return imported, rejected
 
 
 if __name__ == '__main__':
-    users = []
+    parser = argparse.ArgumentParser(description='Record users')
+    parser.add_argument('--list', action='store_true', help='print all users read from the file')
+    parser.add_argument('--count', action='store_true', help='only print the number of users and exit')
+    parser.add_argument('--get', metavar='ID', help='print the record of the user with the given id and exit')
+    parser.add_argument('--import', dest='import_file', metavar='FILE',
+                        help='import users from a JSON lines file and exit')
+    parser.add_argument('--rejects', metavar='FILE',
+                        help='file for records rejected during import; default: <import file>.rejects')
+    parser.add_argument('--workers', type=int, help='number of processes to use for an import')
+    parser.add_argument('--to-binary', metavar='FILE', help='export all users to a binary user file and exit')
+    parser.add_argument('--from-binary', metavar='FILE', help='import all users from a binary user file and exit')
+    parser.add_argument('--where', metavar='FIELD=VALUE', action='append',
+                        help=f'print the records of the users matching all given criteria and exit; FIELD is one of '
+                             f'{", ".join(UserQuery.criteria())}')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='record call counts and latencies of the main functions and write them to FILE on exit')
+    parser.add_argument('--metrics-format', choices=('json', 'prometheus'), default='json',
+                        help='format of the metrics file')
+    parser.add_argument('--profile', metavar='FILE', help='profile the run with cProfile and write the statistics to '
+                                                          'FILE on exit')
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enabled = True
+        atexit.register(metrics.export, args.metrics, args.metrics_format)
+    if args.profile:
+        start_profile(args.profile)
+
+    if args.where:
+        criteria = dict(w.split('=', 1) for w in args.where)
+        try:
+            records = query_users(USER_FILE, criteria)
+        except ValueError as e:
+            parser.error(str(e))
+        for record in records:
+            print(record.decode())
+        print(f'{len(records)} users found')
+        parser.exit()
+
+    if args.to_binary:
+        try:
+            exported = json_to_binary(USER_FILE, args.to_binary)
+        except OSError as e:
+            parser.error(str(e))
+        except models.ValidationError as e:
+            parser.error(f'invalid record in {USER_FILE}: {e}')
+        print(f'{exported} users exported to {args.to_binary}')
+        parser.exit()
+
+    if args.from_binary:
+        try:
+            binary_file = BinaryUserFile(args.from_binary)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        with binary_file, UserStore(USER_FILE) as store:
+            imported, rejected = binary_to_json(binary_file, store)
+        for user_id, reason in rejected:
+            print(f'User {user_id} not imported: {reason}')
+        print(f'{imported} users imported from {args.from_binary}, {len(rejected)} users skipped')
+        parser.exit()
+
+    if args.import_file:
+        rejects_path = args.rejects or f'{args.import_file}.rejects'
+        with UserStore(USER_FILE) as store:
+            imported, rejected = bulk_import(args.import_file, store, rejects_path, workers=args.workers)
+        print(f'{imported} users imported, {rejected} records rejected ({rejects_path})')
+        parser.exit()
+
+    if args.get:
+        record = UserLookup(USER_FILE).get_record(args.get)
+        print(record.decode() if record is not None else f'No user with id {args.get}')
+        parser.exit()
+
     try:
-        with open(USER_FILE, mode='r') as user_file:
-            users = [User.parse_raw(line) for line in user_file.readlines()]
+        if args.list:
+            count = 0
+            for count, u in enumerate(iter_users(USER_FILE), start=1):
+                print(u)
+        else:
+            count = count_users(USER_FILE)
     except FileNotFoundError:
-        pass
+        count = 0
     except Exception as e:
+        count = 0
         print(f'Problem reading users from file: {e}')
 
-    print(f'{len(users)} users read from file({USER_FILE})')
-    print('\n'.join(f'{u}' for u in users))
+    print(f'{count} users in file({USER_FILE})')
+    if args.count:
+        parser.exit()
 
-    while yes_no('Add another user? (Y/N)'):
-        u = User.from_console()
-        if u is not None:
-            users.append(u)
-            with open(USER_FILE, mode='w') as user_file:
-                user_file.write('\n'.join(u.json() for u in users))
+    # loading the index takes time proportional to the number of users: only done once a user has been entered
+    store = None
+    try:
+        while models.yes_no('Add another user? (Y/N)'):
+            u = models.User.from_console()
+            if u is not None:
+                if store is None:
+                    store = UserStore(USER_FILE)
+                try:
+                    store.append(u)
+                except DuplicateEmailError as e:
+                    print(f'User not added: {e}')
+                else:
+                    u.log_created()
+    finally:
+        if store is not None:
+            store.close()
@@ -0,0 +1,428 @@
+"""
+Models of the users recorder (see challenge.py) with their validation and console input. pydantic and email_validator
+take a while to import; challenge.py only imports this module when a record has to be validated or entered.
+"""
+import atexit
+import calendar
+import datetime
+import logging
+import os
+import queue
+import uuid
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Optional, Tuple, get_args, get_origin
+
+# challenge.py uses BaseModel, ValidationError, SHAPE_LIST and ModelField through this module
+from pydantic import BaseModel, Field, EmailStr, ValidationError, validator
+from pydantic.fields import SHAPE_LIST, ModelField
+
+from instrumentation import instrumented
+
+DATE_FORMAT = '%d-%m-%Y'
+BIRTHDAY_FORMAT = '%A %d %B %Y'
+
+
+def choice(prompt: str, options: str) -> str:
+    options = list(options)
+    while (r := input(prompt).lower()) not in options:
+        pass
+    return r
+
+
+def yes_no(prompt: str):
+    return choice(prompt, 'yn') == 'y'
+
+
+@lru_cache(maxsize=None)
+def console_fields(model: type) -> Tuple[Tuple[str, str, Optional[type]], ...]:
+    """
+    Fields of a model to be entered on the console. Determined once per model instead of on each input.
+    :param model: model class
+    :return: tuple of (field name, prompt, item class for lists of InputMixin subclasses else None)
+    """
+    fields = []
+    for name, field in model.__fields__.items():
+        field: ModelField
+        if field.default:
+            # no need to edit this value
+            continue
+        if field.field_info.extra.get('no_edit'):
+            # no need to edit this value
+            continue
+        # check if this is a generic (List)
+        ot = field.outer_type_
+        args = get_args(ot)
+        item_model = None
+        if args:
+            # this is a generic type
+            # we only support lists of InputMixin subclasses
+            origin = get_origin(ot)
+            if origin == list and issubclass(args[0], InputMixin):
+                item_model = args[0]
+            else:
+                raise NotImplementedError
+        fields.append((name, f'{model.__name__}.{name}', item_model))
+    return tuple(fields)
+
+
+class InputMixin:
+    """
+    Mixin to add capability to add an object from the console via the from_console class method
+    """
+    @classmethod
+    def list_from_console(cls, name: str, values=None):
+        values = values or []
+        print(f'{name}: enter list of {cls.__name__} objects')
+        index = 0
+        while True:
+            index += 1
+            print(f'--{cls.__name__} #{index}--')
+            if len(values) >= index:
+                edit_value = values[index - 1]
+            else:
+                edit_value = None
+            v = cls.from_console(current_value=edit_value)
+            if v is None:
+                index -= 1
+            elif len(values) >= index:
+                values[index - 1] = v
+            else:
+                values.append(v)
+            if yes_no(f'Enter further {cls.__name__} objects? (Y/N)'):
+                continue
+            break
+        if index:
+            values = values[:index]
+        else:
+            values = []
+        return values
+
+    @classmethod
+    def from_console(cls, current_value=None):
+        """
+        Input object from console and
+        :return: object or None if input failed
+        """
+        print(f'Enter values for new {cls.__name__} object')
+        obj = None
+        if current_value is not None:
+            assert isinstance(current_value, cls)
+            values = {k: current_value.__dict__[k] for k in cls.__fields__}
+        else:
+            values = dict()
+        while True:
+            for name, prompt, item_model in console_fields(cls):
+                current_value = values.get(name)
+                if item_model is not None:
+                    v = item_model.list_from_console(name=name, values=current_value)
+                else:
+                    if current_value is not None:
+                        # already have a value
+                        # prompt with value and offer option to enter empty string to keep current value
+                        v = input(f'{prompt} ({current_value}), ENTER to keep: ')
+                        v = v or current_value
+                    else:
+                        v = input(f'{prompt}:')
+                values[name] = v
+            try:
+                obj = cls(**values)
+            except ValidationError as e:
+                print('Invalid input')
+                for error in e.raw_errors:
+                    print(f'{error._loc}: input=\'{values[error._loc]}\', error: {error.exc}')
+                if not yes_no('Re-enter? (Y/N)'):
+                    break
+            else:
+                break
+        return obj
+
+
+# fields marked with intern=True have few distinct values. In binary files (see BinaryUserFile) these values are only
+# stored once
+class Contact(BaseModel, InputMixin):
+    type: str = Field(..., intern=True)
+    number: int
+    code: int
+
+
+# the same dates show up again and again; parsed dates are cached
+DATE_CACHE_SIZE = 65536
+
+# lower case day and month names in the current locale; same names as accepted by strptime for %A and %B
+DAY_NAMES = frozenset(d.lower() for d in calendar.day_name)
+MONTH_NUMBERS = {m.lower(): i for i, m in enumerate(calendar.month_name) if m}
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(v: str) -> datetime.date:
+    """
+    Parse a date in DATE_FORMAT (dd-mm-yyyy).
+    Dates in the canonical fixed width format are parsed directly; anything else is handed over to strptime.
+    :param v: date string
+    :return: date
+    :raises: ValueError for unacceptable dates
+    """
+    if len(v) == 10 and v[2] == '-' and v[5] == '-' and v[:2].isdigit() and v[3:5].isdigit() and v[6:].isdigit():
+        return datetime.date(year=int(v[6:]), month=int(v[3:5]), day=int(v[:2]))
+    return datetime.datetime.strptime(v, DATE_FORMAT).date()
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_birthday(v: str) -> datetime.date:
+    """
+    Parse a date in BIRTHDAY_FORMAT ("Friday 01 January 2020"). Like strptime the day name is not checked against the
+    date.
+    :param v: date string
+    :return: date
+    :raises: ValueError for unacceptable dates
+    """
+    parts = v.split(' ')
+    if len(parts) == 4:
+        day_name, day, month, year = parts
+        month = MONTH_NUMBERS.get(month.lower())
+        if (month and day_name.lower() in DAY_NAMES and 0 < len(day) <= 2 and day.isdigit() and len(year) == 4 and
+                year.isdigit()):
+            return datetime.date(year=int(year), month=month, day=int(day))
+    return datetime.datetime.strptime(v, BIRTHDAY_FORMAT).date()
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def format_birthday(date: datetime.date) -> str:
+    """
+    Format a date in BIRTHDAY_FORMAT
+    :param date: date
+    :return: formatted date
+    """
+    return date.strftime(BIRTHDAY_FORMAT)
+
+
+def date_validation(v: str) -> str:
+    """
+    Validate a date string to be dd-mm-yyyy
+    :param v: value to be validated
+    :return: validated string
+    :raises: ValueError for unacceptable dates
+    """
+    v = v.strip()
+    try:
+        parse_date(v)
+    except ValueError:
+        raise ValueError('Dates have to be in DD.MM.YYYY format')
+    return v
+
+
+class JobHistory(BaseModel, InputMixin):
+    role: str = Field(..., intern=True)
+    company: str = Field(..., intern=True)
+    started: str
+    ended: str
+    # stayed: avoid editing. This value is calculated
+    # we are not using a @property b/c properties are not serialized by BaseModel.json()
+    stayed: str = Field(None, no_edit=True)
+
+    @validator('started', 'ended')
+    @instrumented()
+    def validate_started_ended(cls, v: str, values):
+        """
+        Validator for started and ended fields. Make sure the fields are in dd-mm-yyyy format.
+        :param v: value to validate
+        :param values: values already set
+        :return: validates value
+        :raises: ValueError for unacceptable values
+        """
+        started = values.get('started')
+        v = date_validation(v)
+        # parse_date() is cached: no need to parse the dates again
+        if started and parse_date(started) > parse_date(v):
+            raise ValueError('started needs to be before ended')
+        return v
+
+    @validator('stayed', pre=True, always=True)
+    def validate_stayed(cls, v, values):
+        """
+        Validator for stayed field. The value is always calculated from started and ended
+        :param v: value to validate; ignored
+        :param values: values already set
+        :return: calculated value
+        """
+        started = values.get('started')
+        ended = values.get('ended')
+        if started and ended:
+            return cls.stayed_from_started_ended(started, ended)
+        return None
+
+    @staticmethod
+    @instrumented()
+    def stayed_from_started_ended(started, ended):
+        """
+        2/ JobsHistory attribute should be also a list of the user past jobs. One job entry should follow this format :
+        {"role": "cisconian", "company": "cisco", "started": "24-01-2000", "ended": "24-01-3000", "stayed": "1000 yrs 0
+        months 0 days"}
+
+        3/ The stayed attribut inside each job entry, should be deducted from the started & ended values.
+        :param started:
+        :param ended:
+        :return:
+        """
+
+        try:
+            started = parse_date(started)
+            ended = parse_date(ended)
+        except ValueError:
+            return None
+        diff_year = ended.year - started.year
+        diff_month = ended.month - started.month
+        diff_day = ended.day - started.day
+        if diff_day < 0:
+            # add days of previous month
+            last_day_of_previous_month = ended - datetime.timedelta(days=ended.day)
+            diff_day += last_day_of_previous_month.day
+            diff_month -= 1
+        if diff_month < 0:
+            diff_month += 12
+            diff_year -= 1
+        return f'{diff_year} yrs {diff_month} months {diff_day} days'
+
+
+USER_LOG_FILE = 'users.log'
+USER_LOG_MAX_BYTES = 10 * 1024 * 1024
+USER_LOG_BACKUP_COUNT = 5
+
+
+class BatchingRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler which doesn't flush after each record. Records are flushed after flush_every records or when
+    flush() is called explicitly.
+    """
+
+    def __init__(self, filename: str, flush_every: int = 1000, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.flush_every = flush_every
+        self._unflushed = 0
+        # size of the log file including unflushed records
+        self._size = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            msg = f'{self.format(record)}{self.terminator}'
+            if self.stream is None:
+                self.stream = self._open()
+            if self._size is None:
+                self._size = self.stream.seek(0, os.SEEK_END)
+            # maxBytes is in bytes: count the encoded message, not its characters
+            size = len(msg.encode(self.stream.encoding, self.stream.errors))
+            # check the size ourselves: RotatingFileHandler.shouldRollover() would flush the stream for each record
+            if self.maxBytes and self._size and self._size + size > self.maxBytes:
+                self.doRollover()
+                self._size = 0
+            self.stream.write(msg)
+            self._size += size
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        super().flush()
+        self._unflushed = 0
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    Queue listener which flushes its handlers each time the queue runs empty: records arriving in a burst are written
+    as one batch.
+    """
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush()
+        return self.queue.get(block)
+
+
+# user creation is logged through a queue; the log file is written on a background thread
+user_log = logging.getLogger(f'{__name__}.User')
+user_log_handler: Optional[BatchingRotatingFileHandler] = None
+user_log_listener: Optional[BatchingQueueListener] = None
+
+
+def get_user_log() -> logging.Logger:
+    """
+    Get the user log. The log file and the background thread are only set up when the first entry is written.
+    :return: logger
+    """
+    global user_log_handler, user_log_listener
+    if user_log_listener is None:
+        user_log_handler = BatchingRotatingFileHandler(USER_LOG_FILE, maxBytes=USER_LOG_MAX_BYTES,
+                                                       backupCount=USER_LOG_BACKUP_COUNT)
+        user_log_handler.setFormatter(logging.Formatter(fmt='%(asctime)s - %(message)s'))
+        user_log_queue = queue.SimpleQueue()
+        user_log_listener = BatchingQueueListener(user_log_queue, user_log_handler)
+        user_log.addHandler(QueueHandler(user_log_queue))
+        user_log.setLevel(logging.INFO)
+        user_log_listener.start()
+        atexit.register(stop_user_log)
+    return user_log
+
+
+def stop_user_log() -> None:
+    """
+    Write all pending log records on exit
+    :return: None
+    """
+    if user_log_listener is not None:
+        user_log_listener.stop()
+        user_log_handler.close()
+
+
+class User(BaseModel, InputMixin):
+    id: str = Field(default_factory=lambda: f'{uuid.uuid4()}')
+    firstname: str
+    email: EmailStr
+    country: str = Field(..., intern=True)
+    city: str = Field(..., intern=True)
+    zipCode: str
+    currentRole: str = Field(..., intern=True)
+    currentCompany: str = Field(..., intern=True)
+    gender: str = Field(..., intern=True)
+    birthday: str
+    contacts: List[Contact]
+    jobHistory: List[JobHistory]
+
+    @validator('birthday')
+    @instrumented()
+    def validate_birthday(cls, v: str):
+        """
+        Validatoor for birthday field
+        Brithday attribute should be into this string format: "Friday 01 January 2020"
+        we also allow dd-mm-yyyy
+        :param v: value to validate
+        :return: validated and in desired format
+        :raises: ValueError for unacceptable values
+        """
+
+        v = v.strip()
+        try:
+            parse_birthday(v)
+            return v
+        except ValueError:
+            pass
+        # we also allow dd-mm-yyyy
+        date_validation(v)
+        return format_birthday(parse_date(v))
+
+    def log_created(self)->None:
+        """
+        Write a log entry for each user created. Only for users created via console, once the user has been stored
+        :return: None
+        """
+        get_user_log().info(f'{self.id}, {self.firstname} created')
+
+    @classmethod
+    @instrumented('User.parse_raw')
+    def parse_raw(cls, b, **kwargs) -> 'User':
+        return super().parse_raw(b, **kwargs)